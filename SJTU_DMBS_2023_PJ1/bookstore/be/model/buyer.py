@@ -13,10 +13,52 @@ from be.model.mongo_manager import (
     get_book_col,
     user_id_exists,
     store_id_exists,
-    order_id_exists,
     book_id_exists,
+    CANCELABLE_STATES,
+    transition_order,
+    order_transition_failure,
 )
-from be.model.utils import check_expired
+from be.model.utils import ORDER_EXPIRED_TIME_INTERVAL, STREAM_BATCH_SIZE
+
+
+def release_stock(store_id: str, books: list):
+    """Give back the stock reserved for some books of an order.
+
+    Parameters
+    ----------
+    store_id : str
+        The store_id of the store.
+
+    books : list
+        The reserved books. A list of {"book_id": str, "count": int, ...}.
+    """
+    if not books:
+        return
+    get_book_col().bulk_write(
+        [
+            pymongo.UpdateOne(
+                {"_id": {"store_id": store_id, "book_id": book["book_id"]}},
+                {"$inc": {"stock_level": book["count"]}},
+            )
+            for book in books
+        ],
+        ordered=False,
+    )
+
+
+def try_release_stock(store_id: str, books: list):
+    """`release_stock` on an error path, which logs its failure instead of raising.
+
+    The caller returns the error it is handling either way.
+    """
+    try:
+        release_stock(store_id, books)
+    except pymongo.errors.PyMongoError as e:
+        logging.error(
+            "Fail to give back the stock of store {}: {}, {}".format(
+                store_id, books, str(e)
+            )
+        )
 
 
 class BuyerAPI:
@@ -47,6 +89,7 @@ class BuyerAPI:
             The return status. Note that it will return the corresponding order_id.
         """
         order_id = ""
+        order_data_books = []
         try:
             if not user_id_exists(user_id):
                 return error.error_non_exist_user_id(user_id) + (order_id,)
@@ -59,35 +102,33 @@ class BuyerAPI:
             order_data_books = []
 
             for book_id, count in books:
-                cursor = get_book_col().find_one(
+                # Check and decrement the stock in one atomic operation, so that
+                # concurrent buyers can never oversell a book.
+                cursor = get_book_col().find_one_and_update(
                     {
                         "_id": {
                             "store_id": store_id,
                             "book_id": book_id,
-                        }
+                        },
+                        "stock_level": {"$gte": count},
                     },
+                    {"$inc": {"stock_level": -count}},
+                    projection={"price": 1},
                 )
                 if cursor is None:
-                    return error.error_non_exist_book_id(book_id) + (order_id,)
-
-                stock_level = cursor["stock_level"]
-                price = cursor["price"]
-
-                if stock_level < count:
+                    # given back only once, even if the check below fails
+                    try_release_stock(store_id, order_data_books)
+                    order_data_books = []
+                    if (
+                        get_book_col().count_documents(
+                            {"_id": {"store_id": store_id, "book_id": book_id}}
+                        )
+                        == 0
+                    ):
+                        return error.error_non_exist_book_id(book_id) + (order_id,)
                     return error.error_stock_level_low(book_id) + (order_id,)
 
-                cursor = get_book_col().update_one(
-                    {
-                        "_id": {
-                            "store_id": store_id,
-                            "book_id": book_id,
-                        }
-                    },
-                    {"$inc": {"stock_level": -count}},
-                )
-                assert cursor.matched_count > 0
-                assert cursor.modified_count == cursor.matched_count
-
+                price = cursor["price"]
                 total_price += count * price
                 order_data_books.append(
                     {"book_id": book_id, "count": count, "price": price}
@@ -108,9 +149,11 @@ class BuyerAPI:
             )
         except pymongo.errors.PyMongoError as e:
             logging.info("528, {}".format(str(e)))
+            try_release_stock(store_id, order_data_books)
             return 528, "{}".format(str(e)), ""
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
+            try_release_stock(store_id, order_data_books)
             return 530, "{}".format(str(e)), ""
         return 200, "ok", order_id
 
@@ -135,36 +178,49 @@ class BuyerAPI:
             The return status.
         """
         try:
-            cursor = get_order_col().find_one({"_id": order_id})
-            if cursor is None:
-                return error.error_non_exist_order_id(order_id)
-            if cursor["state"] != "unpaid":
-                return error.error_order_state(cursor["state"])
-            if cursor["buyer"] != user_id:
-                return error.error_authorization_fail()
-
-            if check_expired(cursor["timestamp"]):
-                code, message = self.cancel_order(user_id, password, order_id)
-                if code != 200:
-                    return code, message
-
-            total_price = cursor["total_price"]
-
-            cursor = get_user_col().find_one({"_id": user_id})
+            cursor = get_user_col().find_one({"_id": user_id}, {"password": 1})
             if cursor is None:
                 return error.error_non_exist_user_id(user_id)
             if password != cursor["password"]:
                 return error.error_authorization_fail()
 
-            balance = cursor["balance"]
-
-            if balance < total_price:
+            # Reserve the order for this payment first: an unpaid order of the
+            # buyer, not expired, becomes "paying", which no cancel acts on. So
+            # the order is checked before any money moves, and a concurrent cancel
+            # never refunds money that was not debited.
+            cursor = transition_order(
+                order_id,
+                "unpaid",
+                "paying",
+                buyer=user_id,
+                timestamp={"$gte": time.time() - ORDER_EXPIRED_TIME_INTERVAL},
+            )
+            if cursor is None:
+                failure = order_transition_failure(order_id, "unpaid", buyer=user_id)
+                if failure is None:
+                    # the order is expired
+                    code, message = BuyerAPI.cancel_order(user_id, password, order_id)
+                    if code != 200:
+                        return code, message
+                    return error.error_order_state("canceled")
+                if failure[0] == 523:
+                    # paying for the order of another buyer
+                    return error.error_authorization_fail()
+                return failure
+
+            # buyer's balance -= total_price, if it is sufficient. Checked in the
+            # filter, so that concurrent payments cannot overdraw the account.
+            total_price = cursor["total_price"]
+            cursor = get_user_col().update_one(
+                {"_id": user_id, "balance": {"$gte": total_price}},
+                {"$inc": {"balance": -total_price}},
+            )
+            if cursor.matched_count == 0:
+                # no money moved, only the order is given back its state
+                transition_order(order_id, "paying", "unpaid")
                 return error.error_not_sufficient_funds(order_id)
 
-            # buyer's balance -= total_price
-            get_user_col().update_one(
-                {"_id": user_id}, {"$inc": {"balance": -total_price}}
-            )
+            transition_order(order_id, "paying", "paid")
 
             # cursor = get_store_col().find_one({"_id": store})
             # if cursor is None:
@@ -178,9 +234,6 @@ class BuyerAPI:
             # # delete the order
             # result = get_order_col().delete_one({"_id": order_id})
             # assert result.deleted_count == 1
-
-            # update the order state
-            get_order_col().update_one({"_id": order_id}, {"$set": {"state": "paid"}})
         except pymongo.errors.PyMongoError as e:
             return 528, "{}".format(str(e))
         except BaseException as e:
@@ -253,30 +306,29 @@ class BuyerAPI:
             if cursor["password"] != password:
                 return error.error_authorization_fail()
 
-            cursor = get_order_col().find_one({"_id": order_id})
+            # Find the seller to credit before the order is finished, so that a
+            # failure leaves the order delivered. The store of an order never
+            # changes.
+            cursor = get_order_col().find_one({"_id": order_id}, {"store": 1})
             if cursor is None:
                 return error.error_non_exist_order_id(order_id)
-
-            if cursor["state"] != "delivered":
-                return error.error_order_state(cursor["state"])
-
-            if cursor["buyer"] != user_id:
-                return error.error_user_id_match(cursor["buyer"], user_id)
-
-            store_cursor = get_store_col().find_one({"_id": cursor["store"]})
+            store_cursor = get_store_col().find_one(
+                {"_id": cursor["store"]}, {"owner": 1}
+            )
             if store_cursor is None:
-                return error.error_non_exist_store_id(cursor["store"])
-
+                failure = order_transition_failure(order_id, "delivered", buyer=user_id)
+                return failure or error.error_non_exist_store_id(cursor["store"])
             seller = store_cursor["owner"]
+
+            # mark the order finished, if it is a delivered order of the buyer
+            cursor = transition_order(order_id, "delivered", "finished", buyer=user_id)
+            if cursor is None:
+                return order_transition_failure(order_id, "delivered", buyer=user_id)
+
             # seller's balance += total_price
             get_user_col().update_one(
                 {"_id": seller}, {"$inc": {"balance": cursor["total_price"]}}
             )
-
-            # update the order state
-            get_order_col().update_one(
-                {"_id": order_id}, {"$set": {"state": "finished"}}
-            )
         except pymongo.errors.PyMongoError as e:
             return 528, "{}".format(str(e))
         except BaseException as e:
@@ -311,36 +363,18 @@ class BuyerAPI:
             if cursor["password"] != password:
                 return error.error_authorization_fail()
 
-            if not order_id_exists(order_id):
-                return error.error_non_exist_order_id(order_id)
-
-            cursor = get_order_col().find_one({"_id": order_id})
-            if cursor["state"] == "canceled" or cursor["state"] == "finished":
-                return error.error_order_state(cursor["state"])
-
-            # for the book stock
-            for book in cursor["books"]:
-                book_cursor = get_book_col().find_one(
-                    {
-                        "_id": {
-                            "store_id": cursor["store"],
-                            "book_id": book["book_id"],
-                        }
-                    },
+            # Cancel the order first, so that its stock is given back only once.
+            # The returned document is the one before the update.
+            cursor = transition_order(
+                order_id, CANCELABLE_STATES, "canceled", buyer=user_id
+            )
+            if cursor is None:
+                return order_transition_failure(
+                    order_id, CANCELABLE_STATES, buyer=user_id
                 )
 
-                # in the list of the order, so it must exist
-                assert book_cursor is not None
-
-                book_cursor = get_book_col().update_one(
-                    {
-                        "_id": {
-                            "store_id": cursor["store"],
-                            "book_id": book["book_id"],
-                        }
-                    },
-                    {"$inc": {"stock_level": book["count"]}},
-                )
+            # for the book stock, all books in one bulk write
+            release_stock(cursor["store"], cursor["books"])
 
             # for back money
             if cursor["state"] == "paid" or cursor["state"] == "delivered":
@@ -348,10 +382,6 @@ class BuyerAPI:
                 get_user_col().update_one(
                     {"_id": user_id}, {"$inc": {"balance": cursor["total_price"]}}
                 )
-            # update the order state
-            get_order_col().update_one(
-                {"_id": order_id}, {"$set": {"state": "canceled"}}
-            )
 
         except pymongo.errors.PyMongoError as e:
             return 528, "{}".format(str(e))
@@ -360,7 +390,109 @@ class BuyerAPI:
         return 200, "ok"
 
     @staticmethod
-    def query_all_orders(user_id: str, password: str) -> (int, str, list):
+    def cancel_orders(user_id: str, password: str, order_ids: list) -> (int, str, list):
+        """The buyer cancels many orders at once.
+
+        The stock of all the canceled orders is given back in one bulk write,
+        and the refunds are added in one update.
+
+        Parameters
+        ----------
+        user_id : str
+            The user_id of the buyer.
+
+        password : str
+            The password of the buyer.
+
+        order_ids : list
+            The order_ids of the orders to cancel.
+
+        Returns
+        -------
+        (code : int, msg : str, results : list)
+            The return status, and the status of each order as
+            {"order_id": str, "code": int, "message": str}.
+        """
+        try:
+            cursor = get_user_col().find_one({"_id": user_id})
+            if cursor is None:
+                return error.error_non_exist_user_id(user_id) + ([],)
+
+            if cursor["password"] != password:
+                return error.error_authorization_fail() + ([],)
+
+            orders = {
+                order["_id"]: order
+                for order in get_order_col().find(
+                    {"_id": {"$in": order_ids}}, {"buyer": 1, "state": 1}
+                )
+            }
+            results = []
+            for order_id in order_ids:
+                order = orders.get(order_id)
+                if order is None:
+                    code, message = error.error_non_exist_order_id(order_id)
+                elif order["buyer"] != user_id:
+                    code, message = error.error_user_id_match(order["buyer"], user_id)
+                elif order["state"] not in CANCELABLE_STATES:
+                    code, message = error.error_order_state(order["state"])
+                else:
+                    code, message = 200, "ok"
+                    # a repeated order_id is canceled only once
+                    order["state"] = "canceled"
+                results.append({"order_id": order_id, "code": code, "message": message})
+
+            # Cancel the orders one by one, in case some are changed meanwhile, and
+            # merge their books by (store, book).
+            stock = {}
+            refund = 0
+            for result in results:
+                if result["code"] != 200:
+                    continue
+                cursor = get_order_col().find_one_and_update(
+                    {
+                        "_id": result["order_id"],
+                        "state": {"$in": CANCELABLE_STATES},
+                    },
+                    {"$set": {"state": "canceled"}},
+                )
+                if cursor is None:
+                    result["code"], result["message"] = error.error_order_state(
+                        "canceled"
+                    )
+                    continue
+                for book in cursor["books"]:
+                    key = (cursor["store"], book["book_id"])
+                    stock[key] = stock.get(key, 0) + book["count"]
+                if cursor["state"] == "paid" or cursor["state"] == "delivered":
+                    refund += cursor["total_price"]
+
+            if stock:
+                get_book_col().bulk_write(
+                    [
+                        pymongo.UpdateOne(
+                            {"_id": {"store_id": store_id, "book_id": book_id}},
+                            {"$inc": {"stock_level": count}},
+                        )
+                        for (store_id, book_id), count in stock.items()
+                    ],
+                    ordered=False,
+                )
+            if refund > 0:
+                get_user_col().update_one(
+                    {"_id": user_id}, {"$inc": {"balance": refund}}
+                )
+
+        except pymongo.errors.PyMongoError as e:
+            return 528, "{}".format(str(e)), []
+        except BaseException as e:
+            return 530, "{}".format(str(e)), []
+        return 200, "ok", results
+
+    @staticmethod
+    def query_all_orders(
+        user_id: str, password: str, stream: bool = False
+    ) -> (int, str, list):
         """A buyer queries all his orders.
 
         Parameters
@@ -371,6 +503,10 @@ class BuyerAPI:
         password : str
             The password of the buyer.
 
+        stream : bool
+            Whether to return the cursor of the orders instead of a list, which
+            fetches them batch by batch while it is iterated.
+
         Returns
         -------
         (code : int, msg : str, orders: List[dict])
@@ -385,6 +521,8 @@ class BuyerAPI:
                 return error.error_authorization_fail() + ([],)
 
             order_cursors = get_order_col().find({"buyer": user_id})
+            if stream:
+                return 200, "ok", order_cursors.batch_size(STREAM_BATCH_SIZE)
 
         except pymongo.errors.PyMongoError as e:
             return 528, "{}".format(str(e)), []
@@ -2,6 +2,8 @@ from typing import Union
 import logging
 import os
 import pymongo
+from be.model import error
+from be.model.utils import search_fields
 
 
 class MongoManager:
@@ -12,6 +14,21 @@ class MongoManager:
     STORE_COL_NAME: str = "store"
     ORDER_COL_NAME: str = "order"
 
+    OBSOLETE_INDEXES = (
+        (ORDER_COL_NAME, "user_id_1"),
+        (BOOK_COL_NAME, "id_1"),
+        (BOOK_COL_NAME, "original_title_1"),
+        (BOOK_COL_NAME, "translator_1"),
+        (BOOK_COL_NAME, "pub_year_1"),
+        (BOOK_COL_NAME, "pages_1"),
+        (BOOK_COL_NAME, "price_1"),
+        (BOOK_COL_NAME, "currency_unit_1"),
+        (BOOK_COL_NAME, "binding_1"),
+    )
+
+    # books updated per bulk_write when backfilling the search fields
+    BACKFILL_BATCH_SIZE: int = 1000
+
     def __init__(
         self,
         host: str = "localhost",
@@ -29,24 +46,50 @@ class MongoManager:
         self.store_col = self.database[self.STORE_COL_NAME]
         self.order_col = self.database[self.ORDER_COL_NAME]
 
-        # create index for orders
-        self.order_col.create_index([("user_id", 1)])
+        # Indexes created by earlier versions, which no query uses. They only slow
+        # down the writes, so they are dropped here.
+        for col, name in self.OBSOLETE_INDEXES:
+            if name in self.database[col].index_information():
+                self.database[col].drop_index(name)
 
-        # create index for books
-        self.book_col.create_index([("id", 1)])
+        # create index for orders: order history of a buyer or a store, newest
+        # first, and the expired unpaid orders
+        self.order_col.create_index([("buyer", 1), ("timestamp", -1)])
+        self.order_col.create_index([("store", 1), ("timestamp", -1)])
+        self.order_col.create_index(
+            [("timestamp", 1)],
+            name="unpaid_timestamp",
+            partialFilterExpression={"state": "unpaid"},
+        )
 
-        # create text index for title
-        self.book_col.create_index([("title", pymongo.TEXT)])
+        # create index for books: the books of a book id in all stores, in the
+        # order of paging, and the books of a store
+        self.book_col.create_index([("id", 1), ("_id.store_id", 1)])
+        self.book_col.create_index([("_id.store_id", 1), ("title", 1)])
+
+        # create text index for keyword search. The fields are pre-tokenized into
+        # n-grams (see utils.search_fields), so no language-specific stemming.
+        # A collection can only have one text index, drop the old one on title.
+        if "title_text" in self.book_col.index_information():
+            self.book_col.drop_index("title_text")
+        self.book_col.create_index(
+            [
+                ("search_title", pymongo.TEXT),
+                ("search_tags", pymongo.TEXT),
+                ("search_intro", pymongo.TEXT),
+            ],
+            name="search_text",
+            weights={"search_title": 10, "search_tags": 5, "search_intro": 1},
+            default_language="none",
+        )
+        self.book_col.create_index([("tags", 1)])
+        backfilled = self.backfill_search_fields()
+        if backfilled > 0:
+            logging.info("Backfill search fields of {} books.".format(backfilled))
 
+        # only the fields looked up by value are indexed
         self.book_col.create_index([("author", 1)])
         self.book_col.create_index([("publisher", 1)])
-        self.book_col.create_index([("original_title", 1)])
-        self.book_col.create_index([("translator", 1)])
-        self.book_col.create_index([("pub_year", 1)])
-        self.book_col.create_index([("pages", 1)])
-        self.book_col.create_index([("price", 1)])
-        self.book_col.create_index([("currency_unit", 1)])
-        self.book_col.create_index([("binding", 1)])
         self.book_col.create_index([("isbn", 1)])
 
         # This columns are too big to make index or make hashed index for substitution
@@ -72,11 +115,51 @@ class MongoManager:
             "Collection Order Indices: "
             + str(list(dict(self.order_col.index_information()).keys()))
         )
+        try:
+            logging.info("Unused Indices: " + str(self.unused_indexes()))
+        except pymongo.errors.PyMongoError as e:
+            logging.warning("Fail to check indexes: {}".format(e))
+
+    def backfill_search_fields(self, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+        """Add the search fields to the books stored without them.
+
+        Only the books added before the text index existed lack them, and keyword
+        search would miss these books. Returns the number of books updated.
+        """
+        count = 0
+        requests = []
+        for book in self.book_col.find(
+            {"search_title": {"$exists": False}},
+            {"title": 1, "tags": 1, "book_intro": 1, "author_intro": 1},
+        ):
+            requests.append(
+                pymongo.UpdateOne({"_id": book["_id"]}, {"$set": search_fields(book)})
+            )
+            if len(requests) >= batch_size:
+                result = self.book_col.bulk_write(requests, ordered=False)
+                count += result.modified_count
+                requests = []
+        if requests:
+            result = self.book_col.bulk_write(requests, ordered=False)
+            count += result.modified_count
+        return count
+
+    def unused_indexes(self) -> dict:
+        """The indexes never used since the server started, by collection."""
+        unused = {}
+        for col in (self.user_col, self.book_col, self.store_col, self.order_col):
+            unused[col.name] = [
+                stats["name"]
+                for stats in col.aggregate([{"$indexStats": {}}])
+                if stats["accesses"]["ops"] == 0 and stats["name"] != "_id_"
+            ]
+        return unused
 
 
 # Global instance of the manager
 glb_manager: MongoManager = None
 
+
 # Lazy initialization
 def init_database(
     host: str = "localhost",
@@ -123,3 +206,53 @@ def order_id_exists(order_id: str) -> bool:
 
 def book_id_exists(book_id: str) -> bool:
     return get_book_col().count_documents({"_id": book_id}) > 0
+
+
+# states of an order that can still be canceled, not "paying" while a payment
+# is debiting the buyer
+CANCELABLE_STATES = ["unpaid", "paid", "delivered"]
+
+
+def transition_order(
+    order_id: str, expected: Union[str, list], state: str, **conditions
+) -> Union[dict, None]:
+    """Move an order from an `expected` state to `state` by one find_one_and_update.
+
+    The state and the other `conditions` on the order, e.g. buyer=user_id, are in
+    the filter, so that two concurrent transitions of an order cannot both
+    succeed, and the order is not read first.
+
+    Returns the order before the update, None if no order matched. Then
+    `order_transition_failure` tells why.
+    """
+    if isinstance(expected, str):
+        expected = [expected]
+    return get_order_col().find_one_and_update(
+        {"_id": order_id, "state": {"$in": list(expected)}, **conditions},
+        {"$set": {"state": state}},
+    )
+
+
+def order_transition_failure(
+    order_id: str, expected: Union[str, list], buyer: str = None, store: str = None
+) -> Union[tuple, None]:
+    """Why `transition_order` matched no order. Only read on this slow path.
+
+    Returns the error of the first failed check: the order does not exist, it is
+    not in an `expected` state, or it is not an order of `buyer` or `store`. None
+    if the order passes them all, i.e. another condition of the caller failed.
+    """
+    if isinstance(expected, str):
+        expected = [expected]
+    order = get_order_col().find_one(
+        {"_id": order_id}, {"state": 1, "buyer": 1, "store": 1}
+    )
+    if order is None:
+        return error.error_non_exist_order_id(order_id)
+    if order["state"] not in expected:
+        return error.error_order_state(order["state"])
+    if buyer is not None and order["buyer"] != buyer:
+        return error.error_user_id_match(order["buyer"], buyer)
+    if store is not None and order["store"] != store:
+        return error.error_store_id_match(order["store"], store)
+    return None
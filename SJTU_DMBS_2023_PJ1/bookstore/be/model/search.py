@@ -1,5 +1,6 @@
 """Search related APIs."""
 
+import re
 import pymongo
 import logging
 from be.model import error
@@ -14,16 +15,99 @@ from be.model.mongo_manager import (
     order_id_exists,
 )
 from be.model.error import error_invalid_query_book_behaviour
+from be.model.utils import ngram_tokens, CJK_RE, NGRAM_SIZE, STREAM_BATCH_SIZE
+
+# keys of query_book to control the result pages, not restrictions of books
+PAGE_KEYS = ("limit", "page", "after", "after_store_id", "fields")
+
+# the pre-tokenized fields are only for the text index
+SEARCH_FIELDS = ("search_title", "search_tags", "search_intro")
+
+
+def cjk_ngrams(keyword: str) -> list:
+    """The n-grams of the CJK words in the keyword.
+
+    Any text containing the keyword contains these n-grams, even when the
+    keyword starts or ends in the middle of a word.
+    """
+    return [
+        token
+        for token in ngram_tokens(keyword)
+        if CJK_RE.match(token) and len(token) == NGRAM_SIZE
+    ]
+
+
+def text_search(tokens: list) -> dict:
+    """A $text filter matching the books containing all the tokens.
+
+    $text ORs bare terms, so each token is quoted as a phrase, which is ANDed.
+    """
+    return {"$search": " ".join('"{}"'.format(token) for token in tokens)}
 
 
 class SearchAPI:
     @staticmethod
-    def query_book(**kwargs) -> (int, str, list):
+    def __restrict(kwargs) -> dict:
+        """Turn the restrictions in kwargs into a filter document.
+
+        Returns None if the restrictions are invalid.
+        """
+        if "_id" in kwargs:
+            return None
+        if any(key.startswith("$") or key in SEARCH_FIELDS for key in kwargs):
+            return None
+
+        if "store_id" in kwargs:
+            kwargs["_id.store_id"] = kwargs["store_id"]
+            del kwargs["store_id"]
+
+        if "title_keyword" in kwargs:
+            if "title" in kwargs:
+                return None
+
+            kwd = kwargs["title_keyword"]
+            del kwargs["title_keyword"]
+            # The text index narrows down the candidates when it can, and the
+            # regex keeps the substring semantics.
+            ngrams = cjk_ngrams(kwd)
+            if ngrams:
+                kwargs["$text"] = text_search(ngrams)
+            kwargs["title"] = {"$regex": re.escape(kwd)}
+
+        if "keyword" in kwargs:
+            if "$text" in kwargs:
+                return None
+            kwd = kwargs["keyword"]
+            del kwargs["keyword"]
+            tokens = ngram_tokens(kwd)
+            if any(not CJK_RE.match(t) or len(t) >= NGRAM_SIZE for t in tokens):
+                kwargs["$text"] = text_search(tokens)
+            else:
+                # too short to be in the text index
+                pattern = {"$regex": re.escape(kwd)}
+                kwargs["$or"] = [
+                    {"title": pattern},
+                    {"tags": pattern},
+                    {"book_intro": pattern},
+                    {"author_intro": pattern},
+                ]
+
+        if "tag" in kwargs:
+            kwargs["tags"] = kwargs["tag"]
+            del kwargs["tag"]
+        return kwargs
+
+    @staticmethod
+    def query_book(stream: bool = False, **kwargs) -> (int, str, list):
         """
         Query books
 
         Parameters
         ----------
+        stream : bool
+            Whether to return the cursor of the books instead of a list, which
+            fetches them batch by batch while it is iterated.
+
         kwargs : dict
             The restriction of this query.
 
@@ -44,7 +128,16 @@ class SearchAPI:
                 author_intro
                 book_intro
                 content
-                title_keyword
+                title_keyword : a substring of the title
+                keyword : words in the title, tags or intros, ranked by relevance
+                tag : one of the tags
+
+            And the keys to control the result pages:
+                limit : the max number of books returned
+                page : the page number starting from 1, each page has `limit` books
+                after : the id of the last book in the previous page (keyset paging)
+                after_store_id : the store_id of that book, when not querying one store
+                fields : the list of fields returned, e.g. ["id", "title", "price"]
 
         Returns
         -------
@@ -52,25 +145,97 @@ class SearchAPI:
             The return status and the queried books.
         """
         try:
-            if "_id" in kwargs:
+            limit = kwargs.pop("limit", None)
+            page = kwargs.pop("page", None)
+            after = kwargs.pop("after", None)
+            after_store_id = kwargs.pop("after_store_id", None)
+            fields = kwargs.pop("fields", None)
+
+            if page is not None and (limit is None or page < 1):
                 return error_invalid_query_book_behaviour() + ([],)
 
-            if "store_id" in kwargs:
-                kwargs["_id.store_id"] = kwargs["store_id"]
-                del kwargs["store_id"]
+            keyword = kwargs.get("keyword")
+            if keyword is not None and after is not None:
+                # keyset paging does not fit the order of relevance
+                return error_invalid_query_book_behaviour() + ([],)
 
-            if "title_keyword" in kwargs:
-                if "title" in kwargs:
+            projection = {field: 0 for field in SEARCH_FIELDS}
+            if fields is not None:
+                if not fields or any(
+                    not isinstance(field, str)
+                    or field.startswith("$")
+                    or field in SEARCH_FIELDS
+                    for field in fields
+                ):
                     return error_invalid_query_book_behaviour() + ([],)
+                projection = {field: 1 for field in fields}
+
+            query = SearchAPI.__restrict(kwargs)
+            if query is None:
+                return error_invalid_query_book_behaviour() + ([],)
+            ranked = keyword is not None and "$text" in query
+            if ranked:
+                projection["score"] = {"$meta": "textScore"}
 
-                kwd = kwargs["title_keyword"]
-                del kwargs["title_keyword"]
-                # kwargs["$text"] = {"$search": kwd}
-                kwargs["title"] = {"$regex": kwd}
+            if after is not None:
+                if after_store_id is not None:
+                    keyset = {
+                        "$or": [
+                            {"id": {"$gt": after}},
+                            {"id": after, "_id.store_id": {"$gt": after_store_id}},
+                        ]
+                    }
+                else:
+                    keyset = {"id": {"$gt": after}}
+                query = {"$and": [query, keyset]}
 
-            cursor = get_book_col().find(kwargs)
+            cursor = get_book_col().find(query, projection)
+            if ranked:
+                cursor = cursor.sort(
+                    [("score", {"$meta": "textScore"}), ("id", 1), ("_id.store_id", 1)]
+                )
+            elif limit is not None or after is not None:
+                # a stable order is needed to cut pages
+                cursor = cursor.sort([("id", 1), ("_id.store_id", 1)])
+            if page is not None:
+                cursor = cursor.skip((page - 1) * limit)
+            if limit is not None:
+                cursor = cursor.limit(limit)
+            if stream:
+                return 200, "ok", cursor.batch_size(STREAM_BATCH_SIZE)
+            ret = list(cursor)
         except pymongo.errors.PyMongoError as e:
             return 528, "{}".format(str(e)), None
         except BaseException as e:
             return 530, "{}".format(str(e)), None
-        return 200, "ok", list(cursor)
+        return 200, "ok", ret
+
+    @staticmethod
+    def count_book(**kwargs) -> (int, str, int):
+        """
+        Count the books matching the restriction, ignoring the page keys.
+
+        Parameters
+        ----------
+        kwargs : dict
+            The restriction of this query. The same as `query_book`.
+
+        Returns
+        -------
+        (code : int, msg : str, total: int)
+            The return status and the number of matched books.
+        """
+        try:
+            for key in PAGE_KEYS:
+                kwargs.pop(key, None)
+
+            query = SearchAPI.__restrict(kwargs)
+            if query is None:
+                return error_invalid_query_book_behaviour() + (0,)
+
+            total = get_book_col().count_documents(query)
+        except pymongo.errors.PyMongoError as e:
+            return 528, "{}".format(str(e)), 0
+        except BaseException as e:
+            return 530, "{}".format(str(e)), 0
+        return 200, "ok", total
@@ -7,12 +7,14 @@ from be.model.mongo_manager import (
     get_store_col,
     get_book_col,
     get_user_col,
-    get_order_col,
     user_id_exists,
     store_id_exists,
     book_id_exists,
     order_id_exists,
+    transition_order,
+    order_transition_failure,
 )
+from be.model.utils import search_fields, ADD_BOOKS_BATCH_SIZE
 
 
 class SellerAPI:
@@ -65,6 +67,7 @@ class SellerAPI:
                     "stock_level": stock_level,
                 }
             )
+            book_info.update(search_fields(book_info))
             get_book_col().insert_one(book_info)
         except pymongo.errors.DuplicateKeyError as e:
             return error.error_exist_book_id(book_id)
@@ -77,6 +80,115 @@ class SellerAPI:
 
         return 200, "ok"
 
+    @staticmethod
+    def add_books(
+        user_id: str,
+        store_id: str,
+        books,
+        batch_size: int = ADD_BOOKS_BATCH_SIZE,
+    ) -> (int, str, list):
+        """Add many books to a store.
+
+        The books are inserted in batches, each batch by one unordered
+        insert_many, so that a duplicate book does not stop the others.
+
+        Parameters
+        ----------
+        user_id : str
+            The user_id of the seller.
+
+        store_id : str
+            The store_id of the store.
+
+        books : Iterable[dict]
+            The books as {"book_info": dict, "stock_level": int}. It can be a
+            lazy iterator, it is consumed batch by batch.
+
+        batch_size : int
+            The number of books in a batch.
+
+        Returns
+        -------
+        (code : int, msg : str, results : List[dict])
+            The return status, and the status of each book as
+            {"book_id": str, "code": int, "message": str}. After an error of
+            the database, the books of the failed and later batches are left out.
+        """
+        results = []
+        try:
+            if not user_id_exists(user_id):
+                return error.error_non_exist_user_id(user_id) + ([],)
+            if not store_id_exists(store_id):
+                return error.error_non_exist_store_id(store_id) + ([],)
+
+            batch = []
+            for item in books:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    results += SellerAPI.__add_book_batch(store_id, batch)
+                    batch = []
+            if batch:
+                results += SellerAPI.__add_book_batch(store_id, batch)
+
+        except pymongo.errors.PyMongoError as e:
+            logging.info("528, {}".format(str(e)))
+            return 528, "{}".format(str(e)), results
+        except BaseException as e:
+            logging.info("530, {}".format(str(e)))
+            return 530, "{}".format(str(e)), results
+
+        return 200, "ok", results
+
+    @staticmethod
+    def __add_book_batch(store_id: str, items: list) -> list:
+        """Insert a batch of books, returns the status of each book."""
+        statuses = [None] * len(items)
+        book_ids = [None] * len(items)
+        documents = []
+        # index of the document -> index of the item
+        positions = []
+        for i, item in enumerate(items):
+            book_info = item.get("book_info") if isinstance(item, dict) else None
+            book_id = book_info.get("id") if isinstance(book_info, dict) else None
+            stock_level = item.get("stock_level", 0) if book_id is not None else None
+            if isinstance(book_id, str):
+                book_ids[i] = book_id
+            if (
+                book_ids[i] is None
+                or not isinstance(stock_level, int)
+                or any(key == "_id" or key.startswith("$") for key in book_info)
+            ):
+                statuses[i] = error.error_and_message(530, "invalid book info")
+                continue
+
+            document = dict(book_info)
+            document.update(
+                {
+                    "_id": {"store_id": store_id, "book_id": book_id},
+                    "stock_level": stock_level,
+                }
+            )
+            document.update(search_fields(document))
+            documents.append(document)
+            positions.append(i)
+
+        if documents:
+            try:
+                get_book_col().insert_many(documents, ordered=False)
+            except pymongo.errors.BulkWriteError as e:
+                for write_error in e.details["writeErrors"]:
+                    i = positions[write_error["index"]]
+                    if write_error["code"] == 11000:
+                        statuses[i] = error.error_exist_book_id(book_ids[i])
+                    else:
+                        statuses[i] = 528, write_error["errmsg"]
+
+        results = []
+        for book_id, status in zip(book_ids, statuses):
+            code, message = status if status is not None else (200, "ok")
+            results.append({"book_id": book_id, "code": code, "message": message})
+        return results
+
     @staticmethod
     def add_stock_level(
         user_id: str, store_id: str, book_id: str, add_stock_level: int
@@ -189,23 +301,12 @@ class SellerAPI:
             The return status.
         """
         try:
-            if not store_id_exists(store_id):
-                return error.error_non_exist_store_id(store_id)
-
-            cursor = get_order_col().find_one({"_id": order_id})
+            # mark the order delivered, if it is a paid order of the store
+            cursor = transition_order(order_id, "paid", "delivered", store=store_id)
             if cursor is None:
-                return error.error_non_exist_order_id(order_id)
-
-            if cursor["state"] != "paid":
-                return error.error_order_state(cursor["state"])
-
-            if cursor["store"] != store_id:
-                return error.error_store_id_match(cursor["store"], store_id)
-
-            # update the order state
-            get_order_col().update_one(
-                {"_id": order_id}, {"$set": {"state": "delivered"}}
-            )
+                if not store_id_exists(store_id):
+                    return error.error_non_exist_store_id(store_id)
+                return order_transition_failure(order_id, "paid", store=store_id)
 
         except pymongo.errors.PyMongoError as e:
             logging.info("528, {}".format(str(e)))
@@ -1,7 +1,20 @@
+import re
 import time
 
 ORDER_EXPIRED_TIME_INTERVAL = 10
 
+# documents fetched per round trip by the cursors of streaming responses
+STREAM_BATCH_SIZE = 500
+
+# books inserted per insert_many by the bulk add_books
+ADD_BOOKS_BATCH_SIZE = 1000
+
+# CJK text has no spaces between words, so it is split into n-grams.
+CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+TOKEN_RE = re.compile("[{0}]+|[^\\W{0}]+".format(CJK_CHARS))
+CJK_RE = re.compile("[{}]".format(CJK_CHARS))
+NGRAM_SIZE = 2
+
 
 def check_expired(timestamp: float) -> bool:
     """Check whether an order is expired."""
@@ -9,3 +22,32 @@ def check_expired(timestamp: float) -> bool:
     if time.time() - timestamp > ORDER_EXPIRED_TIME_INTERVAL:
         return True
     return False
+
+
+def ngram_tokens(text: str) -> list:
+    """Split a text into search tokens.
+
+    A run of CJK characters becomes its overlapping n-grams (a run shorter than
+    n is kept as it is), other words are lowercased.
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(text or ""):
+        if CJK_RE.match(run) and len(run) > NGRAM_SIZE:
+            tokens.extend(
+                run[i : i + NGRAM_SIZE] for i in range(len(run) - NGRAM_SIZE + 1)
+            )
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def search_fields(book_info: dict) -> dict:
+    """The pre-tokenized fields of a book covered by the text index."""
+    return {
+        "search_title": " ".join(ngram_tokens(book_info.get("title"))),
+        "search_tags": " ".join(ngram_tokens(" ".join(book_info.get("tags") or []))),
+        "search_intro": " ".join(
+            ngram_tokens(book_info.get("book_intro"))
+            + ngram_tokens(book_info.get("author_intro"))
+        ),
+    }
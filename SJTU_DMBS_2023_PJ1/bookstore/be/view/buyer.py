@@ -1,7 +1,9 @@
 from flask import Blueprint
 from flask import request
 from flask import jsonify
+from be.view.response import stream_response, STREAM_FORMATS
 from be.model.buyer import BuyerAPI
+from be.model.error import error_invalid_query_order_behaviour
 
 bp_buyer = Blueprint("buyer", __name__, url_prefix="/buyer")
 
@@ -62,12 +64,31 @@ def cancel_order():
     return jsonify({"message": message}), code
 
 
+@bp_buyer.route("/cancel_orders", methods=["POST"])
+def cancel_orders():
+    user_id = request.json.get("user_id")
+    password = request.json.get("password")
+    order_ids = request.json.get("order_ids")
+    b = BuyerAPI()
+    code, message, results = b.cancel_orders(user_id, password, order_ids)
+    return jsonify({"message": message, "results": results}), code
+
+
 @bp_buyer.route("/query_all_orders", methods=["POST"])
 def query_all_orders():
     user_id = request.json.get("user_id")
     password = request.json.get("password")
+    stream = request.json.get("stream")
+    if stream is not None and stream not in STREAM_FORMATS:
+        code, message = error_invalid_query_order_behaviour()
+        return jsonify({"message": message, "orders": []}), code
+
     b = BuyerAPI()
-    code, message, orders = b.query_all_orders(user_id, password)
+    code, message, orders = b.query_all_orders(
+        user_id, password, stream=stream is not None
+    )
+    if stream is not None and code == 200:
+        return stream_response(stream, {"message": message}, "orders", orders, code)
     return jsonify({"message": message, "orders": orders}), code
 
 
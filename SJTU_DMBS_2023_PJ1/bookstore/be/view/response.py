@@ -0,0 +1,78 @@
+"""Streaming JSON responses of the views.
+
+Large result sets are written chunk by chunk while the cursor is iterated,
+either as a JSON object whose list is streamed, or as NDJSON with one item per
+line, so that a request never holds the whole result in memory.
+"""
+
+import json
+
+from flask import Response, stream_with_context
+from be.model.utils import STREAM_BATCH_SIZE
+
+# values of the "stream" key of a request
+STREAM_FORMATS = ("json", "ndjson")
+
+
+def dumps(data) -> str:
+    """Encode data as compact JSON, keeping non-ASCII text readable."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _encoded_batches(items, batch_size: int):
+    """Encode the items, yielding them in lists of at most batch_size."""
+    batch = []
+    for item in items:
+        batch.append(dumps(item))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_response(
+    stream_format: str,
+    head: dict,
+    key: str,
+    items,
+    code: int = 200,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Response:
+    """A chunked response of the items, encoded while they are iterated.
+
+    Parameters
+    ----------
+    stream_format : str
+        "json" for the object `head` with the items as a list under `key`, the
+        same document as jsonify would return. "ndjson" for one item per line,
+        `head` and `key` are left out.
+
+    items : iterable
+        The items, usually a cursor fetching them from the database batch by
+        batch. It is consumed in the context of the request.
+    """
+    if stream_format == "ndjson":
+
+        def generate():
+            for batch in _encoded_batches(items, batch_size):
+                yield "\n".join(batch) + "\n"
+
+        mimetype = "application/x-ndjson"
+    else:
+
+        def generate():
+            # the head without its closing brace, then the list
+            prefix = dumps(head)[:-1]
+            if head:
+                prefix += ","
+            yield prefix + dumps(key) + ":["
+            separator = ""
+            for batch in _encoded_batches(items, batch_size):
+                yield separator + ",".join(batch)
+                separator = ","
+            yield "]}"
+
+        mimetype = "application/json"
+
+    return Response(stream_with_context(generate()), status=code, mimetype=mimetype)
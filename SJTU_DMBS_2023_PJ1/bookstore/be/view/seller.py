@@ -31,6 +31,36 @@ def seller_add_book():
     return jsonify({"message": message}), code
 
 
+def _ndjson_items(stream):
+    """Parse the lines of an NDJSON upload lazily, None for a malformed line."""
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+@bp_seller.route("/add_books", methods=["POST"])
+def seller_add_books():
+    # a JSON document with the list of books, or an NDJSON upload with one book
+    # per line and the ids in the query string
+    if request.mimetype == "application/x-ndjson":
+        user_id: str = request.args.get("user_id")
+        store_id: str = request.args.get("store_id")
+        books = _ndjson_items(request.stream)
+    else:
+        user_id: str = request.json.get("user_id")
+        store_id: str = request.json.get("store_id")
+        books: list = request.json.get("books", [])
+
+    s = seller.SellerAPI()
+    code, message, results = s.add_books(user_id, store_id, books)
+
+    return jsonify({"message": message, "results": results}), code
+
+
 @bp_seller.route("/add_stock_level", methods=["POST"])
 def add_stock_level():
     user_id: str = request.json.get("user_id")
@@ -71,14 +71,38 @@ class Buyer:
         r = requests.post(url, headers=headers, json=json)
         return r.status_code
 
-    def query_all_orders(self) -> (int, list):
+    def cancel_orders(self, order_ids: [str]) -> (int, list):
+        json = {
+            "user_id": self.user_id,
+            "password": self.password,
+            "order_ids": order_ids,
+        }
+        url = urljoin(self.url_prefix, "cancel_orders")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json)
+        response_json = r.json()
+        return r.status_code, response_json.get("results")
+
+    def query_all_orders(self, **kwargs) -> (int, list):
         json = {"user_id": self.user_id, "password": self.password}
+        json.update(kwargs)
         url = urljoin(self.url_prefix, "query_all_orders")
         headers = {"token": self.token}
         r = requests.post(url, headers=headers, json=json)
         response_json = r.json()
         return r.status_code, response_json.get("orders")
 
+    def query_all_orders_ndjson(self) -> (int, list):
+        json = {"user_id": self.user_id, "password": self.password, "stream": "ndjson"}
+        url = urljoin(self.url_prefix, "query_all_orders")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json, stream=True)
+        if r.status_code != 200:
+            return r.status_code, r.json().get("orders")
+        return r.status_code, [
+            simplejson.loads(line) for line in r.iter_lines() if line
+        ]
+
     def query_one_order(self, order_id: str) -> (int, dict):
         json = {
             "user_id": self.user_id,
@@ -1,4 +1,5 @@
 import requests
+import simplejson
 from urllib.parse import urljoin
 
 
@@ -6,8 +7,24 @@ class Search:
     def __init__(self, url_prefix):
         self.url_prefix = urljoin(url_prefix, "search/")
 
-    def query_book(self, **kwargs) -> int:
+    def query_book(self, **kwargs) -> (int, list):
         json = kwargs
         url = urljoin(self.url_prefix, "query_book")
         r = requests.post(url, json=json)
-        return r.status_code, r.json().get("books")
\ No newline at end of file
+        return r.status_code, r.json().get("books")
+
+    def query_book_with_total(self, **kwargs) -> (int, list, int):
+        json = dict(kwargs, with_total=True)
+        url = urljoin(self.url_prefix, "query_book")
+        r = requests.post(url, json=json)
+        return r.status_code, r.json().get("books"), r.json().get("total")
+
+    def query_book_ndjson(self, **kwargs) -> (int, list):
+        json = dict(kwargs, stream="ndjson")
+        url = urljoin(self.url_prefix, "query_book")
+        r = requests.post(url, json=json, stream=True)
+        if r.status_code != 200:
+            return r.status_code, r.json().get("books")
+        return r.status_code, [
+            simplejson.loads(line) for line in r.iter_lines() if line
+        ]
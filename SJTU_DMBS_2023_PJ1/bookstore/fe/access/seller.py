@@ -1,4 +1,5 @@
 import requests
+import simplejson
 from urllib.parse import urljoin
 from fe.access import book
 from fe.access.auth import Auth
@@ -39,6 +40,38 @@ class Seller:
         print("ms",r.json().get("message"))
         return r.status_code
 
+    def add_books(self, store_id: str, stock_level: int, books: [book.Book]) -> (int, list):
+        json = {
+            "user_id": self.seller_id,
+            "store_id": store_id,
+            "books": [
+                {"book_info": b.__dict__, "stock_level": stock_level} for b in books
+            ],
+        }
+        url = urljoin(self.url_prefix, "add_books")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json)
+        return r.status_code, r.json().get("results")
+
+    def add_books_ndjson(
+        self, store_id: str, stock_level: int, books: [book.Book]
+    ) -> (int, list):
+        lines = (
+            simplejson.dumps({"book_info": b.__dict__, "stock_level": stock_level})
+            + "\n"
+            for b in books
+        )
+        url = urljoin(self.url_prefix, "add_books")
+        headers = {"token": self.token, "Content-Type": "application/x-ndjson"}
+        params = {"user_id": self.seller_id, "store_id": store_id}
+        r = requests.post(
+            url,
+            headers=headers,
+            params=params,
+            data="".join(lines).encode("utf-8"),
+        )
+        return r.status_code, r.json().get("results")
+
     def add_stock_level(
         self, seller_id: str, store_id: str, book_id: str, add_stock_num: int
     ) -> int:
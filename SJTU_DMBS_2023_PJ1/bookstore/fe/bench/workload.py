@@ -124,11 +124,11 @@ class Workload:
                     books = self.book_db.get_book_info(row_no, self.batch_size)
                     if len(books) == 0:
                         break
-                    for bk in books:
-                        code = seller.add_book(store_id, self.stock_level, bk)
-                        assert code == 200
-                        if i == 1 and j == 1:
-                            self.book_ids.append(bk.id)
+                    code, results = seller.add_books(store_id, self.stock_level, books)
+                    assert code == 200
+                    assert all(r["code"] == 200 for r in results)
+                    if i == 1 and j == 1:
+                        self.book_ids += [bk.id for bk in books]
                     row_no = row_no + len(books)
         logging.info("seller data loaded.")
         for k in range(1, self.buyer_num + 1):
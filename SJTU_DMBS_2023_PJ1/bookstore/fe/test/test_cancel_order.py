@@ -105,6 +105,16 @@ class TestCancelOrder:
         code = self.buyer.cancel_order("xxx")
         assert code == 520
 
+    def test_cancel_another_guy_order(self):
+        b1 = register_new_buyer(
+            "test_cancel_order_buyer_id_{}".format(str(uuid.uuid1())), self.password1
+        )
+        code = b1.cancel_order(self.order_id1)
+        assert code == 523
+
+        code = self.buyer.cancel_order(self.order_id1)
+        assert code == 200
+
     def test_repeat_cancel(self):
         code = self.buyer.add_funds(self.total_price1)
         assert code == 200
@@ -117,3 +127,28 @@ class TestCancelOrder:
 
         code = self.buyer.cancel_order(self.order_id1)
         assert code != 200
+
+    def test_cancel_orders_ok(self):
+        code = self.buyer.add_funds(self.total_price1)
+        assert code == 200
+        code = self.buyer.payment(self.order_id1)
+        assert code == 200
+
+        code, results = self.buyer.cancel_orders(
+            [self.order_id1, self.order_id2, "xxx"]
+        )
+        assert code == 200
+        assert [r["code"] for r in results] == [200, 200, 520]
+
+        # a canceled order can not be paid
+        code = self.buyer.payment(self.order_id1)
+        assert code != 200
+
+        code, results = self.buyer.cancel_orders([self.order_id1])
+        assert code == 200
+        assert results[0]["code"] != 200
+
+    def test_cancel_orders_authorization_error(self):
+        self.buyer.password += "_x"
+        code, results = self.buyer.cancel_orders([self.order_id1, self.order_id2])
+        assert code == 401
@@ -6,6 +6,7 @@ from fe.test.gen_book_data import GenBook
 from fe.access.new_buyer import register_new_buyer
 from fe.access.book import Book
 from fe.access.auth import Auth
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 
 
@@ -31,6 +32,7 @@ class TestPayment:
             non_exist_book_id=False, low_stock_level=False, max_book_count=5
         )
         self.buy_book_info_list1 = gen_book1.buy_book_info_list
+        self.buy_book_id_list1 = buy_book_id_list1
         assert ok1
 
         # for unregister
@@ -117,6 +119,43 @@ class TestPayment:
         code = self.buyer.payment(self.order_id2)
         assert code != 200
 
+    def test_concurrent_payments(self):
+        # enough funds for either order, not for both
+        code = self.buyer.add_funds(max(self.total_price1, self.total_price2))
+        assert code == 200
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            codes = list(
+                executor.map(self.buyer.payment, [self.order_id1, self.order_id2])
+            )
+        assert codes.count(200) == 1
+
+    def test_pay_and_cancel_race(self):
+        # not enough funds, so whichever wins, nothing is debited or refunded
+        code = self.buyer.add_funds(self.total_price1 - 1)
+        assert code == 200
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            payment = executor.submit(self.buyer.payment, self.order_id1)
+            cancel = executor.submit(self.buyer.cancel_order, self.order_id1)
+        assert payment.result() != 200
+        # 522 if the cancel came while the payment was debiting
+        assert cancel.result() in (200, 522)
+
+        # a refund of the unpaid order would make the balance sufficient
+        code, order_id = self.buyer.new_order(self.store_id1, self.buy_book_id_list1)
+        assert code == 200
+        code = self.buyer.payment(order_id)
+        assert code == 519
+
+    def test_repeat_pay_concurrently(self):
+        code = self.buyer.add_funds(self.total_price1 * 2)
+        assert code == 200
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            codes = list(executor.map(self.buyer.payment, [self.order_id1] * 2))
+        assert codes.count(200) == 1
+
     def test_authorization_error(self):
         code = self.buyer.add_funds(self.total_price1)
         assert code == 200
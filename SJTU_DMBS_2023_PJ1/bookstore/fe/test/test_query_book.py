@@ -4,6 +4,7 @@ from fe.access.new_seller import register_new_seller
 from fe.access import book
 from fe.access.search import Search
 from fe import conf
+from be.model import mongo_manager
 import uuid
 
 
@@ -60,3 +61,138 @@ class TestQueryBook:
                 assert code == 200
                 assert len(result) > 0
                 assert result[0]["title"] == b.title
+
+    def test_page_ok(self):
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+
+        code, first = self.search.query_book(store_id=self.store_id, limit=1, page=1)
+        assert code == 200
+        assert len(first) == 1
+        code, second = self.search.query_book(store_id=self.store_id, limit=1, page=2)
+        assert code == 200
+        assert len(second) == 1
+        assert first[0]["id"] != second[0]["id"]
+
+    def test_after_ok(self):
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+
+        code, first = self.search.query_book(store_id=self.store_id, limit=1)
+        assert code == 200
+        code, rest = self.search.query_book(
+            store_id=self.store_id, after=first[0]["id"]
+        )
+        assert code == 200
+        assert len(rest) == len(self.books) - 1
+        assert all(b["id"] > first[0]["id"] for b in rest)
+
+    def test_fields_ok(self):
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+
+        code, result = self.search.query_book(
+            store_id=self.store_id, fields=["id", "title", "price"]
+        )
+        assert code == 200
+        assert len(result) == len(self.books)
+        for b in result:
+            assert "title" in b and "price" in b
+            assert "content" not in b and "pictures" not in b
+
+    def test_total_ok(self):
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+
+        code, result, total = self.search.query_book_with_total(
+            store_id=self.store_id, limit=1
+        )
+        assert code == 200
+        assert len(result) == 1
+        assert total == len(self.books)
+
+    def test_stream_ok(self):
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+
+        code, result, total = self.search.query_book_with_total(
+            store_id=self.store_id, stream="json"
+        )
+        assert code == 200
+        assert sorted(r["id"] for r in result) == sorted(b.id for b in self.books)
+        assert total == len(self.books)
+
+        code, result = self.search.query_book_ndjson(store_id=self.store_id)
+        assert code == 200
+        assert sorted(r["id"] for r in result) == sorted(b.id for b in self.books)
+
+    def test_invalid_stream(self):
+        code, result = self.search.query_book(store_id=self.store_id, stream="xml")
+        assert code == 525
+        code, result = self.search.query_book_ndjson(store_id=self.store_id, page=1)
+        assert code == 525
+
+    def test_invalid_page(self):
+        code, result = self.search.query_book(store_id=self.store_id, page=1)
+        assert code == 525
+
+    def test_keyword_query_ok(self):
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+
+        for b in self.books:
+            code, result = self.search.query_book(
+                store_id=self.store_id, keyword=b.title
+            )
+            assert code == 200
+            assert b.id in [r["id"] for r in result]
+
+    def test_keyword_all_tokens(self):
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+
+        # every word of the keyword must match, not any of them
+        for b in self.books:
+            keyword = "{} qzxjvkw".format(b.title)
+            code, result, total = self.search.query_book_with_total(
+                store_id=self.store_id, keyword=keyword
+            )
+            assert code == 200
+            assert result == [] and total == 0
+
+    def test_keyword_backfilled(self):
+        # a book stored before the search fields were added by add_book
+        b = self.books[0]
+        document = dict(b.__dict__)
+        document["_id"] = {"store_id": self.store_id, "book_id": b.id}
+        document["stock_level"] = 0
+        mongo_manager.get_book_col().insert_one(document)
+
+        assert mongo_manager.glb_manager.backfill_search_fields() >= 1
+        code, result = self.search.query_book(store_id=self.store_id, keyword=b.title)
+        assert code == 200
+        assert [r["id"] for r in result] == [b.id]
+
+    def test_tag_query_ok(self):
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+
+        for b in self.books:
+            if len(b.tags) > 0:
+                code, result = self.search.query_book(
+                    store_id=self.store_id, tag=b.tags[0]
+                )
+                assert code == 200
+                assert b.id in [r["id"] for r in result]
+
+    def test_invalid_keyword_after(self):
+        code, result = self.search.query_book(keyword="xxx", after="xxx")
+        assert code == 525
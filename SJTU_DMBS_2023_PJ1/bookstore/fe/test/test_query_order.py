@@ -76,6 +76,29 @@ class TestOrderState:
         code, order = self.buyer.query_one_order(self.order_id)
         assert code == 401
 
+    def test_all_orders_stream_ok(self):
+        code, self.order_id1 = self.buyer.new_order(self.store_id, [])
+        assert code == 200
+
+        code, orders = self.buyer.query_all_orders(stream="json")
+        assert code == 200
+        assert sorted(o["_id"] for o in orders) == sorted(
+            [self.order_id, self.order_id1]
+        )
+
+        code, orders = self.buyer.query_all_orders_ndjson()
+        assert code == 200
+        assert sorted(o["_id"] for o in orders) == sorted(
+            [self.order_id, self.order_id1]
+        )
+
+    def test_all_orders_stream_error(self):
+        code, orders = self.buyer.query_all_orders(stream="xml")
+        assert code == 526
+        self.buyer.password += "_x"
+        code, orders = self.buyer.query_all_orders_ndjson()
+        assert code == 401
+
     def test_all_orders_authorization_error(self):
         self.buyer.password += "_x"
         code, order = self.buyer.query_all_orders()
@@ -1,4 +1,8 @@
+from be import conf
 from be import serve
 
 if __name__ == "__main__":
-    serve.be_run()
+    if conf.WORKERS > 1:
+        serve.be_run_workers()
+    else:
+        serve.be_run()
@@ -0,0 +1,234 @@
+"""Offline import of the book catalogue from the SQLite book database.
+
+The books are streamed from the SQLite file and loaded by COPY FROM STDIN into
+the BookInfo table, which is far faster than adding them through the API. The
+secondary indexes of BookInfo are dropped before the load and built once after
+it. With several workers, the books are split into ranges of ids, each loaded
+by its own process and connection.
+
+It is meant for the initial load: a book already in BookInfo fails the COPY of
+its range, and that range is rolled back.
+
+Usage:
+    python -m be.import_books [--db fe/data/book.db] [--workers 4] [--keep-indexes]
+"""
+
+import os
+import csv
+import time
+import base64
+import logging
+import argparse
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import create_engine, Integer, text
+from sqlalchemy.pool import NullPool
+from be import conf
+from be.model.base import BookInfo, SQLInstance
+from be.model.utils import serialize_dict
+
+# columns of BookInfo loaded from SQLite, the search vector is computed
+COLUMNS = [column for column in BookInfo.__table__.columns if not column.computed]
+
+# columns selected from the SQLite book table, the picture is turned into the
+# list of pictures
+SQLITE_COLUMNS = [c.name for c in COLUMNS if c.name != "pictures"] + ["picture"]
+
+COPY_SQL = 'COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+    BookInfo.__tablename__, ", ".join('"{}"'.format(c.name) for c in COLUMNS)
+)
+
+# characters handed to COPY per read
+COPY_BUFFER_SIZE = 1 << 20
+
+
+def book_row(record: dict) -> list:
+    """The values of a BookInfo row from a row of the SQLite book table.
+
+    The values are stored as `SellerAPI.add_book` stores them: lists and None
+    as JSON. A missing pages or price is 0.
+    """
+    book = dict(record)
+    picture = book.pop("picture")
+    book["tags"] = [tag for tag in (book["tags"] or "").split("\n") if tag.strip()]
+    book["pictures"] = (
+        [base64.b64encode(picture).decode("utf-8")] if picture is not None else []
+    )
+    book = serialize_dict(book)
+    row = []
+    for column in COLUMNS:
+        value = book[column.name]
+        if isinstance(column.type, Integer) and not isinstance(value, int):
+            value = 0
+        row.append(value)
+    return row
+
+
+class CsvStream:
+    """A file-like object reading rows as CSV, generated while COPY reads it."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.count = 0
+        self.data = ""
+        self.done = False
+        # strings are always quoted, so that an empty string is not NULL
+        self.writer = csv.writer(self, quoting=csv.QUOTE_NONNUMERIC)
+
+    def write(self, s: str):
+        self.data += s
+
+    def read(self, size: int = -1) -> str:
+        while (size < 0 or len(self.data) < size) and not self.done:
+            row = next(self.rows, None)
+            if row is None:
+                self.done = True
+            else:
+                self.writer.writerow(row)
+                self.count += 1
+        if size < 0:
+            size = len(self.data)
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+def read_books(db_path: str, low: str = None, high: str = None):
+    """Stream the books of the SQLite database, with low <= id < high."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    sql = "SELECT {} FROM book".format(", ".join(SQLITE_COLUMNS))
+    conditions, params = [], []
+    if low is not None:
+        conditions.append("id >= ?")
+        params.append(low)
+    if high is not None:
+        conditions.append("id < ?")
+        params.append(high)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    try:
+        for record in conn.execute(sql, params):
+            yield book_row(record)
+    finally:
+        conn.close()
+
+
+def split_ids(db_path: str, parts: int) -> list:
+    """Split the ids into ranges of about the same number of books.
+
+    Returns the (low, high) bounds of each range, None means unbounded.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        count = conn.execute("SELECT count(id) FROM book").fetchone()[0]
+        bounds = []
+        for i in range(1, parts):
+            row = conn.execute(
+                "SELECT id FROM book ORDER BY id LIMIT 1 OFFSET ?",
+                (count * i // parts,),
+            ).fetchone()
+            if row is not None and (not bounds or row[0] > bounds[-1]):
+                bounds.append(row[0])
+    finally:
+        conn.close()
+    bounds = [None] + bounds + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def load_range(db_path: str, url: str, low: str, high: str) -> int:
+    """COPY the books with low <= id < high in one transaction.
+
+    Runs in a worker process, with a connection of its own. Returns the number
+    of books loaded.
+    """
+    engine = create_engine(url, poolclass=NullPool)
+    conn = engine.raw_connection()
+    try:
+        stream = CsvStream(read_books(db_path, low, high))
+        with conn.cursor() as cursor:
+            cursor.copy_expert(COPY_SQL, stream, size=COPY_BUFFER_SIZE)
+        conn.commit()
+        return stream.count
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        engine.dispose()
+
+
+def import_books(
+    db_path: str, url: str = conf.DB_URL, workers: int = 1, keep_indexes: bool = False
+) -> int:
+    """Import the books of the SQLite database into BookInfo.
+
+    Returns the number of books loaded.
+    """
+    # create the tables and the extensions as the server does, without replacing
+    # the database of this process, e.g. of a server running the tests
+    SQLInstance(url).engine.dispose()
+    engine = create_engine(url, poolclass=NullPool)
+    indexes = [] if keep_indexes else list(BookInfo.__table__.indexes)
+
+    start = time.time()
+    for index in indexes:
+        index.drop(engine, checkfirst=True)
+
+    total = 0
+    try:
+        ranges = split_ids(db_path, max(workers, 1))
+        if len(ranges) == 1:
+            total = load_range(db_path, url, None, None)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=len(ranges),
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                futures = [
+                    executor.submit(load_range, db_path, url, low, high)
+                    for low, high in ranges
+                ]
+                for future in futures:
+                    total += future.result()
+        logging.info("Loaded {} books in {:.1f}s.".format(total, time.time() - start))
+    finally:
+        # build the indexes once, even after a failed load
+        for index in indexes:
+            index.create(engine, checkfirst=True)
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE "{}"'.format(BookInfo.__tablename__)))
+        engine.dispose()
+
+    logging.info(
+        "Imported {} books in {:.1f}s with indexes.".format(total, time.time() - start)
+    )
+    return total
+
+
+def main():
+    data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "fe", "data")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--db",
+        default=os.path.join(data_path, "book.db"),
+        help="the SQLite book database, e.g. fe/data/book_lx.db",
+    )
+    parser.add_argument("--url", default=conf.DB_URL, help="the PostgreSQL URL")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes loading ranges of ids"
+    )
+    parser.add_argument(
+        "--keep-indexes",
+        action="store_true",
+        help="load with the indexes of BookInfo instead of building them after",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import_books(args.db, args.url, args.workers, args.keep_indexes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""In-process cache of verified credentials."""
+
+from typing import Optional, Tuple
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from be import conf
+from be.model import error
+from be.model.base import get_session, User
+from be.model.password import hasher, is_hashed
+
+
+class AuthCache:
+    """A TTL and LRU cache of the credentials verified recently, keyed by user id.
+
+    It keeps a salted fingerprint of the password, never the password itself,
+    with the stored hash it was verified against, and the current token with its
+    issue time. A hit only saves the hashing or the token decoding: the callers
+    still read the stored hash or token of the user, a cheap lookup by primary
+    key, and an entry matches only if they are unchanged. So a password change,
+    a logout or an unregister handled by another worker process is seen at
+    once. A miss or a mismatch always falls back to the full check.
+    """
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # user_id -> {"password": bytes, "stored": str, "password_expire": float,
+        #             "token": str, "ts": float, "token_expire": float}
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._salt = os.urandom(16)
+
+    def _fingerprint(self, password: str) -> bytes:
+        return hashlib.sha256(self._salt + password.encode("utf-8")).digest()
+
+    def _get(self, user_id: str) -> Optional[dict]:
+        """Get the entry of a user, requires the lock."""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        if max(entry["password_expire"], entry["token_expire"]) < time.time():
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return entry
+
+    def _put(self, user_id: str, slot: str, **values):
+        """Update the `slot` of the entry of a user, requires the lock.
+
+        Only the expire time of that slot, "password" or "token", is renewed.
+        """
+        entry = self._get(user_id)
+        if entry is None:
+            entry = {
+                "password": None,
+                "stored": None,
+                "password_expire": 0.0,
+                "token": None,
+                "ts": None,
+                "token_expire": 0.0,
+            }
+            self.entries[user_id] = entry
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        entry.update(values)
+        entry[slot + "_expire"] = time.time() + self.ttl
+
+    def check_password(self, user_id: str, password: str, stored: str) -> bool:
+        """Whether the password is verified recently against the `stored` hash."""
+        with self.lock:
+            entry = self._get(user_id)
+            if (
+                entry is not None
+                and entry["password_expire"] >= time.time()
+                and entry["stored"] == stored
+                and entry["password"] == self._fingerprint(password)
+            ):
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def check_token(self, user_id: str, token: str) -> Optional[float]:
+        """The issue time of the token if it is verified recently, else None.
+
+        The caller checks first that the token is still the one of the user.
+        """
+        with self.lock:
+            entry = self._get(user_id)
+            if (
+                entry is not None
+                and entry["token_expire"] >= time.time()
+                and entry["token"] == token
+            ):
+                self.hits += 1
+                return entry["ts"]
+            self.misses += 1
+            return None
+
+    def put_password(self, user_id: str, password: str, stored: str):
+        with self.lock:
+            self._put(
+                user_id,
+                "password",
+                password=self._fingerprint(password),
+                stored=stored,
+            )
+
+    def put_token(self, user_id: str, token: str, ts: float):
+        with self.lock:
+            self._put(user_id, "token", token=token, ts=ts)
+
+    def invalidate(self, user_id: str):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# global instance of the cache of this process, None if disabled
+auth_cache: AuthCache = None
+if conf.AUTH_CACHE_SIZE > 0 and conf.AUTH_CACHE_TTL > 0:
+    auth_cache = AuthCache(conf.AUTH_CACHE_SIZE, conf.AUTH_CACHE_TTL)
+
+
+def verify_password(
+    user_id: str, password: str, rehash: bool = False
+) -> Tuple[int, str]:
+    """Check the password of a user, with the cache of verified credentials.
+
+    Parameters
+    ----------
+    rehash : bool
+        Whether to replace a legacy plaintext password with its hash, when it
+        matches. The update is committed by the caller.
+
+    Returns
+    -------
+    (code : int, msg : str)
+        200 if matched, 511 if the user does not exist, 401 if mismatched.
+    """
+    # the stored hash is read even on a hit of the cache, so that a changed
+    # password or a removed user is never accepted from it
+    session = get_session()
+    result = session.query(User.password).filter(User.id == user_id).first()
+    if result is None:
+        return error.error_non_exist_user_id(user_id)
+    stored = result.password
+    if auth_cache is not None and auth_cache.check_password(user_id, password, stored):
+        return 200, "ok"
+    if not hasher.verify(password, stored):
+        return error.error_authorization_fail()
+
+    if rehash and not is_hashed(stored):
+        # unless the password is changed meanwhile
+        hashed = hasher.hash(password)
+        session.query(User).filter(User.id == user_id, User.password == stored).update(
+            {"password": hashed}
+        )
+        stored = hashed
+
+    if auth_cache is not None:
+        auth_cache.put_password(user_id, password, stored)
+    return 200, "ok"
+
+
+def cache_token(user_id: str, token: str, ts: float):
+    if auth_cache is not None:
+        auth_cache.put_token(user_id, token, ts)
+
+
+def cached_token_ts(user_id: str, token: str) -> Optional[float]:
+    if auth_cache is None:
+        return None
+    return auth_cache.check_token(user_id, token)
+
+
+def invalidate_user(user_id: str):
+    if auth_cache is not None:
+        auth_cache.invalidate(user_id)
+
+
+def get_auth_cache_stats() -> dict:
+    if auth_cache is None:
+        return {"enabled": False}
+    return dict(auth_cache.get_stats(), enabled=True)
@@ -0,0 +1,101 @@
+"""Background workers running a batched job periodically in each process."""
+
+from typing import Optional
+
+import time
+import logging
+import threading
+
+from sqlalchemy.exc import SQLAlchemyError
+
+
+class BatchWorker:
+    """A daemon thread running `run_batch` every `interval` seconds.
+
+    A subclass handles at most `batch_size` rows in one transaction in
+    `run_batch`, and locks them with FOR UPDATE SKIP LOCKED, so that the workers
+    of several processes share the work instead of blocking each other. Each run
+    repeats the batches until one is not full.
+    """
+
+    # name of the thread, and the message logged after a run doing some work
+    name: str = "BatchWorker"
+    log_message: str = "{} rows handled."
+    # the stats counted by run_batch, through add_stats
+    counters: tuple = ()
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.stats = {"runs": 0, "batches": 0, "errors": 0, "last_run": None}
+        self.stats.update({counter: 0 for counter in self.counters})
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+
+    def run_batch(self) -> int:
+        """Handle one batch and commit. Returns the number of rows handled."""
+        raise NotImplementedError
+
+    def add_stats(self, **counts):
+        """Count a batch done, with the `counters` it adds to."""
+        with self.lock:
+            self.stats["batches"] += 1
+            for counter, count in counts.items():
+                self.stats[counter] += count
+
+    def run_all(self) -> int:
+        """Run the batches until no full batch is left.
+
+        Returns the number of rows handled.
+        """
+        total = 0
+        while True:
+            count = self.run_batch()
+            total += count
+            if count < self.batch_size:
+                break
+        with self.lock:
+            self.stats["runs"] += 1
+            self.stats["last_run"] = time.time()
+        return total
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                count = self.run_all()
+                if count > 0:
+                    logging.info(self.log_message.format(count))
+            except SQLAlchemyError as e:
+                logging.error(e)
+                with self.lock:
+                    self.stats["errors"] += 1
+
+    def start(self):
+        # a daemon thread, so that it never blocks the process from exiting
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return dict(self.stats, interval=self.interval, batch_size=self.batch_size)
+
+
+def start_worker(cls, interval: float, batch_size: int) -> Optional[BatchWorker]:
+    """Start a worker of the class, None if it is disabled by interval <= 0."""
+    if interval <= 0:
+        return None
+    worker = cls(interval, batch_size)
+    worker.start()
+    return worker
+
+
+def worker_stats(worker: Optional[BatchWorker]) -> dict:
+    if worker is None:
+        return {"enabled": False}
+    return dict(worker.get_stats(), enabled=True)
@@ -7,10 +7,47 @@ import uuid
 
 import logging
 from be.model import error
-from be.model.base import get_session, Book, User, Order, Store, OrderDetail
-
+from be.model.base import (
+    session_scope,
+    StoreInventory,
+    User,
+    Order,
+    Store,
+    OrderDetail,
+    BalanceJournal,
+)
+
+from sqlalchemy import (
+    column,
+    exists,
+    insert,
+    literal,
+    select,
+    update,
+    values,
+    String,
+    Integer,
+)
 from sqlalchemy.exc import SQLAlchemyError
-from be.model.utils import check_expired, user_id_exists, store_id_exists, to_dict
+from be.model.utils import (
+    ORDER_EXPIRED_TIME_INTERVAL,
+    CANCELABLE_STATUSES,
+    restore_stock,
+    reserve_sharded_stock,
+    settle_balances,
+    current_balance,
+    transition_order,
+    order_transition_failure,
+    valid_order_page,
+    query_order_history,
+    query_orders_with_details,
+)
+from be.model.auth_cache import verify_password
+
+# A transaction updating several kinds of rows locks them in the same order:
+# the orders, then the balance journal, then the users, then the store
+# inventory and its stock shards, so that payment and cancellation of the same
+# order cannot deadlock.
 
 
 class BuyerAPI:
@@ -41,65 +78,118 @@ class BuyerAPI:
             The return status. Note that it will return the corresponding order_id.
         """
         try:
-            uid = "{}_{}_{}".format(user_id, store_id, str(uuid.uuid1()))
-            total_price = 0
-            order_id = uid
-
-            if not user_id_exists(user_id):
-                return error.error_non_exist_user_id(user_id) + (order_id,)
-            if not store_id_exists(store_id):
-                return error.error_non_exist_store_id(store_id) + (order_id,)
-
-            session = get_session()
-            books_data = []
-
-            for book_id, count in books:
-                cursor = session.query(Book).filter_by(id=book_id, store_id=store_id)
-                result = cursor.first()
-
-                if result is None:
-                    return error.error_non_exist_book_id(book_id) + (order_id,)
-
-                stock_level = result.stock_level
-                price = result.price
-
-                if stock_level < count:
-                    return error.error_stock_level_low(book_id) + (order_id,)
-
-                cursor.update({"stock_level": Book.stock_level - count})
-
-                total_price += count * price
-                books_data.append([book_id, count, price])
-
-            now_time = time.time()
-            order = Order(
-                id=order_id,
-                buyer=user_id,
-                store_id=store_id,
-                total_price=total_price,
-                status="unpaid",
-                timestamp=now_time,
-            )
-            session.add(order)
-
-            for book_id, count, price in books_data:
-                order_data_book = OrderDetail(
-                    order_id=order_id,
-                    book_id=book_id,
-                    count=count,
-                    price=price,
+            with session_scope() as session:
+                uid = "{}_{}_{}".format(user_id, store_id, str(uuid.uuid1()))
+                order_id = uid
+
+                # Both existence checks in one round trip, inside the order transaction.
+                user_exists, store_exists = session.query(
+                    exists().where(User.id == user_id),
+                    exists().where(Store.id == store_id),
+                ).one()
+                if not user_exists:
+                    return error.error_non_exist_user_id(user_id) + (order_id,)
+                if not store_exists:
+                    return error.error_non_exist_store_id(store_id) + (order_id,)
+
+                # Merge repeated lines, so that each book is reserved by one row.
+                book_counts = {}
+                for book_id, count in books:
+                    book_counts[book_id] = book_counts.get(book_id, 0) + count
+
+                prices = {}
+                if book_counts:
+                    # Reserve the whole basket in one set-based statement: UPDATE
+                    # StoreInventory ... FROM (VALUES ...) WHERE stock_level >= count
+                    basket = values(
+                        column("book_id", String),
+                        column("count", Integer),
+                        name="basket",
+                    ).data(list(book_counts.items()))
+                    cursor = session.execute(
+                        update(StoreInventory)
+                        .where(
+                            StoreInventory.store_id == store_id,
+                            StoreInventory.book_id == basket.c.book_id,
+                            StoreInventory.stock_level >= basket.c.count,
+                            StoreInventory.shards == 0,
+                        )
+                        .values(stock_level=StoreInventory.stock_level - basket.c.count)
+                        .returning(StoreInventory.book_id, StoreInventory.price)
+                        .execution_options(synchronize_session=False)
+                    )
+                    prices = dict(cursor.all())
+
+                missing = [book_id for book_id in book_counts if book_id not in prices]
+                if missing:
+                    # The sharded books are reserved from their shards, one by one
+                    # in the order of their ids.
+                    sharded = session.execute(
+                        select(StoreInventory.book_id, StoreInventory.price)
+                        .where(
+                            StoreInventory.store_id == store_id,
+                            StoreInventory.book_id.in_(missing),
+                            StoreInventory.shards > 0,
+                        )
+                        .order_by(StoreInventory.book_id)
+                    ).all()
+                    for book_id, price in sharded:
+                        if reserve_sharded_stock(
+                            session, store_id, book_id, book_counts[book_id]
+                        ):
+                            prices[book_id] = price
+                    missing = [book_id for book_id in missing if book_id not in prices]
+
+                if missing:
+                    # Slow path: some lines are not reserved. Release the reserved ones
+                    # and find out the reason of the first failed line.
+                    session.rollback()
+                    existing = {
+                        book_id
+                        for (book_id,) in session.query(StoreInventory.book_id).filter(
+                            StoreInventory.store_id == store_id,
+                            StoreInventory.book_id.in_(missing),
+                        )
+                    }
+                    for book_id in missing:
+                        if book_id not in existing:
+                            return error.error_non_exist_book_id(book_id) + (order_id,)
+                    return error.error_stock_level_low(missing[0]) + (order_id,)
+
+                total_price = sum(
+                    count * prices[book_id] for book_id, count in book_counts.items()
                 )
-                session.add(order_data_book)
 
-            session.commit()
-            session.close()
+                session.execute(
+                    insert(Order).values(
+                        id=order_id,
+                        buyer=user_id,
+                        store_id=store_id,
+                        total_price=total_price,
+                        status="unpaid",
+                        timestamp=time.time(),
+                    )
+                )
+                if book_counts:
+                    session.execute(
+                        insert(OrderDetail),
+                        [
+                            {
+                                "order_id": order_id,
+                                "book_id": book_id,
+                                "count": count,
+                                "price": prices[book_id],
+                            }
+                            for book_id, count in book_counts.items()
+                        ],
+                    )
+
+                session.commit()
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e)), ""
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
             return 530, "{}".format(str(e)), ""
 
         return 200, "ok", order_id
@@ -125,65 +215,64 @@ class BuyerAPI:
             The return status.
         """
         try:
-            # Part 1. Get the order info.
-            session = get_session()
-
-            result = session.query(Order).filter(Order.id == order_id).first()
-            if result is None:
-                return error.error_non_exist_order_id(order_id)
-
-            if result.status != "unpaid":
-                session.close()
-                return error.error_order_status(result.status)
-
-            if result.buyer is None:
-                session.close()
-                return error.error_non_exist_user_id(user_id)
-
-            if result.buyer != user_id:
-                session.close()
-                return error.error_authorization_fail()
-
-            if check_expired(result.timestamp):
-                code, message = BuyerAPI.cancel_order(user_id, password, order_id)
+            with session_scope() as session:
+                # Part 1. Check the user password.
+                code, message = verify_password(user_id, password)
                 if code != 200:
                     return code, message
-                session.close()
-                return error.error_order_status("canceled")
-
-            total_price = result.total_price
-
-            # Part 2. Get the user info and update the buyer balance.
-            cursor = session.query(User).filter(User.id == user_id)
-            result = cursor.first()
-            if result is None:
-                session.close()
-                return error.error_non_exist_user_id(user_id)
-
-            if password != result.password:
-                session.close()
-                return error.error_authorization_fail()
-
-            balance = result.balance
 
-            if balance < total_price:
-                session.close()
-                return error.error_not_sufficient_funds(order_id)
-
-            # buyer's balance -= total_price
-            cursor.update({"balance": User.balance - total_price})
-
-            # Part 3. Update the order status.
-            session.query(Order).filter(Order.id == order_id).update({"status": "paid"})
-            session.commit()
-            session.close()
+                # Part 2. Mark the order paid, if it is an unpaid order of the
+                # buyer, not expired.
+                result = transition_order(
+                    session,
+                    order_id,
+                    "unpaid",
+                    "paid",
+                    Order.buyer == user_id,
+                    Order.timestamp >= time.time() - ORDER_EXPIRED_TIME_INTERVAL,
+                    returning=(Order.total_price,),
+                )
+                if result is None:
+                    failure = order_transition_failure(
+                        session, order_id, "unpaid", buyer=user_id
+                    )
+                    if failure is None:
+                        # the order is expired
+                        code, message = BuyerAPI.cancel_order(
+                            user_id, password, order_id
+                        )
+                        if code != 200:
+                            return code, message
+                        return error.error_order_status("canceled")
+                    if failure[0] == 523:
+                        # paying for the order of another buyer
+                        return error.error_authorization_fail()
+                    return failure
+
+                total_price = result.total_price
+
+                # Part 3. buyer's balance -= total_price, if it is sufficient.
+                # Checked by the update itself, so that concurrent payments
+                # cannot overdraw the account. Otherwise the order update is
+                # rolled back.
+                debit = (
+                    update(User)
+                    .where(User.id == user_id, User.balance >= total_price)
+                    .values(balance=User.balance - total_price)
+                    .execution_options(synchronize_session=False)
+                )
+                cursor = session.execute(debit)
+                if cursor.rowcount == 0 and settle_balances(session, user_id) > 0:
+                    # the credits not settled yet may cover it
+                    cursor = session.execute(debit)
+                if cursor.rowcount == 0:
+                    return error.error_not_sufficient_funds(order_id)
+                session.commit()
         except SQLAlchemyError as e:
             logging.error(e)
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.error(e)
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
@@ -209,33 +298,61 @@ class BuyerAPI:
             The return status.
         """
         try:
-            session = get_session()
-            cursor = session.query(User).filter(User.id == user_id)
-            result = cursor.first()
-
-            if result is None:
-                session.close()
-                return error.error_non_exist_user_id(user_id)
-
-            if result.password != password:
-                session.close()
-                return error.error_authorization_fail()
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message
 
-            # balance += add_value
-            cursor.update({"balance": User.balance + add_value})
+                # balance += add_value
+                session.query(User).filter(User.id == user_id).update(
+                    {"balance": User.balance + add_value}
+                )
 
-            session.commit()
-            session.close()
+                session.commit()
         except SQLAlchemyError as e:
             logging.error(e)
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.error(e)
-            session.rollback()
             return 530, "{}".format(str(e))
         return 200, "ok"
 
+    @staticmethod
+    def query_balance(user_id: str, password: str) -> Tuple[int, str, int]:
+        """Query the balance of an account.
+
+        It includes the credits of the balance journal not settled yet.
+
+        Parameters
+        ----------
+        user_id : str
+            The user_id of the account.
+
+        password : str
+            The password of the account.
+
+        Returns
+        -------
+        (code : int, msg : str, balance : int)
+            The return status and the balance.
+        """
+        try:
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message, None
+
+                balance = current_balance(session, user_id)
+                if balance is None:
+                    return error.error_non_exist_user_id(user_id) + (None,)
+        except SQLAlchemyError as e:
+            logging.error(e)
+            return 528, "{}".format(str(e)), None
+        except BaseException as e:
+            logging.error(e)
+            return 530, "{}".format(str(e)), None
+        return 200, "ok", balance
+
     @staticmethod
     def mark_order_received(
         user_id: str, password: str, order_id: str
@@ -259,62 +376,50 @@ class BuyerAPI:
             The return status.
         """
         try:
-            # Part 1. Check the user password.
-            session = get_session()
-            result = session.query(User).filter(User.id == user_id).first()
-
-            if result is None:
-                session.close()
-                return error.error_non_exist_user_id(user_id)
-
-            if result.password != password:
-                session.close()
-                return error.error_authorization_fail()
-
-            # Part 2. Update the order status
-            cursor = session.query(Order).filter(Order.id == order_id)
-            result = cursor.first()
-
-            if result is None:
-                session.close()
-                return error.error_non_exist_order_id(order_id)
-
-            if result.status != "delivered":
-                session.close()
-                return error.error_order_status(result.status)
-
-            if result.buyer != user_id:
-                session.close()
-                return error.error_user_id_match(result.buyer, user_id)
-
-            # Part 3. Get the store.
-            store_result = (
-                session.query(Store).filter(Store.id == result.store_id).first()
-            )
-            if store_result is None:
-                session.close()
-                return error.error_non_exist_store_id(result.store_id)
-
-            seller = store_result.owner
-
-            # seller's balance += total_price
-            session.query(User).filter(User.id == seller).update(
-                {"balance": User.balance + result.total_price}
-            )
-
-            # update the order status
-            session.query(Order).filter(Order.id == order_id).update(
-                {"status": "finished"}
-            )
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                # Part 1. Check the user password.
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message
+
+                # Part 2. Mark the order finished, if it is a delivered order of
+                # the buyer.
+                result = transition_order(
+                    session,
+                    order_id,
+                    "delivered",
+                    "finished",
+                    Order.buyer == user_id,
+                    returning=(Order.store_id, Order.total_price),
+                )
+                if result is None:
+                    return order_transition_failure(
+                        session, order_id, "delivered", buyer=user_id
+                    )
+
+                # Part 3. Credit the seller with total_price through the
+                # balance journal, so that the orders of a store do not wait for
+                # each other on the seller's row. The seller is found by the
+                # insert itself.
+                credit = select(
+                    Store.owner,
+                    literal(result.total_price),
+                    literal(order_id),
+                    literal(time.time()),
+                ).where(Store.id == result.store_id)
+                cursor = session.execute(
+                    insert(BalanceJournal).from_select(
+                        ["user_id", "amount", "order_id", "timestamp"], credit
+                    )
+                )
+                if cursor.rowcount == 0:
+                    return error.error_non_exist_store_id(result.store_id)
+                session.commit()
         except SQLAlchemyError as e:
             logging.error(e)
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.error(e)
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
@@ -340,68 +445,52 @@ class BuyerAPI:
             The return status.
         """
         try:
-            session = get_session()
-            result = session.query(User).filter(User.id == user_id).first()
-            if result is None:
-                session.close()
-                return error.error_non_exist_user_id(user_id)
-
-            if result.password != password:
-                session.close()
-                return error.error_authorization_fail()
-
-            result = session.query(Order).filter(Order.id == order_id).first()
-            if result is None:
-                return error.error_non_exist_order_id(order_id)
-
-            order_status = result.status
-            store = result.store_id
-            total_price = result.total_price
-
-            if order_status == "canceled" or order_status == "finished":
-                return error.error_order_status(order_status)
-
-            # for the book stock
-            book_orders = (
-                session.query(OrderDetail)
-                .filter(OrderDetail.order_id == order_id)
-                .all()
-            )
-            for book_order in book_orders:
-                session.query(Book).filter_by(
-                    id=book_order.book_id, store_id=store
-                ).update(
-                    {
-                        "stock_level": Book.stock_level + book_order.count,
-                    },
-                )
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message
 
-            # for back money
-            if order_status == "paid" or order_status == "delivered":
-                # buyer's balance -= total_price
-                session.query(User).filter(User.id == user_id).update(
-                    {"balance": User.balance + total_price},
+                # cancel the order first, so that its stock is given back only once
+                result = transition_order(
+                    session,
+                    order_id,
+                    CANCELABLE_STATUSES,
+                    "canceled",
+                    Order.buyer == user_id,
+                    returning=(Order.total_price,),
                 )
-            # update the order status
-            session.query(Order).filter(Order.id == order_id).update(
-                {"status": "canceled"}
-            )
-            session.commit()
-            session.close()
+                if result is None:
+                    return order_transition_failure(
+                        session, order_id, CANCELABLE_STATUSES, buyer=user_id
+                    )
+
+                # for back money
+                if result.previous == "paid" or result.previous == "delivered":
+                    # buyer's balance += total_price
+                    session.query(User).filter(User.id == user_id).update(
+                        {"balance": User.balance + result.total_price},
+                    )
+
+                # for the book stock, all lines in one statement
+                restore_stock(session, [order_id])
+                session.commit()
         except SQLAlchemyError as e:
             logging.error(e)
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.error(e)
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
 
     @staticmethod
-    def query_all_orders(user_id: str, password: str) -> Tuple[int, str, list]:
-        """A buyer queries all his orders.
+    def cancel_orders(
+        user_id: str, password: str, order_ids: List[str]
+    ) -> Tuple[int, str, list]:
+        """The buyer cancels many orders at once.
+
+        The orders that can be canceled are canceled together: their stock is
+        given back in one statement and the refunds are added in another.
 
         Parameters
         ----------
@@ -411,38 +500,154 @@ class BuyerAPI:
         password : str
             The password of the buyer.
 
+        order_ids : List[str]
+            The order_ids of the orders to cancel.
+
         Returns
         -------
-        (code : int, msg : str, orders: List[dict])
-            The return status and the queried orders.
+        (code : int, msg : str, results : List[dict])
+            The return status, and the status of each order as
+            {"order_id": str, "code": int, "message": str}.
         """
         try:
-            session = get_session()
-            result = session.query(User).filter(User.id == user_id).first()
-            if result is None:
-                session.close()
-                return error.error_non_exist_user_id(user_id) + ([],)
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message, []
+
+                # lock the orders, so that their stock is given back only once
+                orders = {
+                    order.id: order
+                    for order in session.query(
+                        Order.id, Order.buyer, Order.status, Order.total_price
+                    )
+                    .filter(Order.id.in_(order_ids))
+                    .order_by(Order.id)
+                    .with_for_update()
+                }
+
+                results = []
+                canceled = []
+                refund = 0
+                for order_id in order_ids:
+                    order = orders.get(order_id)
+                    if order is None:
+                        code, message = error.error_non_exist_order_id(order_id)
+                    elif order.buyer != user_id:
+                        code, message = error.error_user_id_match(order.buyer, user_id)
+                    elif order_id in canceled or order.status in (
+                        "canceled",
+                        "finished",
+                    ):
+                        code, message = error.error_order_status(
+                            "canceled" if order_id in canceled else order.status
+                        )
+                    else:
+                        code, message = 200, "ok"
+                        canceled.append(order_id)
+                        if order.status == "paid" or order.status == "delivered":
+                            refund += order.total_price
+                    results.append(
+                        {"order_id": order_id, "code": code, "message": message}
+                    )
+
+                if canceled:
+                    session.query(Order).filter(Order.id.in_(canceled)).update(
+                        {"status": "canceled"}, synchronize_session=False
+                    )
+                    if refund > 0:
+                        session.query(User).filter(User.id == user_id).update(
+                            {"balance": User.balance + refund},
+                        )
+                    restore_stock(session, canceled)
+                session.commit()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            return 528, "{}".format(str(e)), []
+        except BaseException as e:
+            logging.error(e)
+            return 530, "{}".format(str(e)), []
+
+        return 200, "ok", results
+
+    @staticmethod
+    def query_all_orders(
+        user_id: str,
+        password: str,
+        limit: int = None,
+        before_timestamp: float = None,
+        status: str = None,
+        with_details: bool = False,
+        with_titles: bool = False,
+        stream: bool = False,
+    ) -> Tuple[int, str, list]:
+        """A buyer queries his orders, newest first.
+
+        Parameters
+        ----------
+        user_id : str
+            The user_id of the buyer.
 
-            if result.password != password:
-                session.close()
-                return error.error_authorization_fail() + ([],)
+        password : str
+            The password of the buyer.
+
+        limit : int
+            The max number of orders returned.
+
+        before_timestamp : float
+            Only the orders created before it. Pass the timestamp of the last
+            order of the previous page to get the next page.
+
+        status : str
+            Only the orders in this status.
+
+        with_details : bool
+            Whether to include the lines of each order as "details".
+
+        with_titles : bool
+            Whether to include the title of the book in each line.
+
+        stream : bool
+            Whether to return the orders as an iterator, which fetches them
+            batch by batch while it is consumed in the same request.
 
-            orders = session.query(Order).filter(Order.buyer == user_id).all()
+        Returns
+        -------
+        (code : int, msg : str, orders: List[dict])
+            The return status and the queried orders.
+        """
+        try:
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message, []
+
+                if not valid_order_page(limit, before_timestamp, status):
+                    return error.error_invalid_query_order_behaviour() + ([],)
+
+                result = query_order_history(
+                    session,
+                    Order.buyer,
+                    user_id,
+                    limit=limit,
+                    before_timestamp=before_timestamp,
+                    status=status,
+                    with_details=with_details,
+                    with_titles=with_titles,
+                    stream=stream,
+                )
         except SQLAlchemyError as e:
-            session.close()
             return 528, "{}".format(str(e)), []
         except BaseException as e:
-            session.close()
             return 530, "{}".format(str(e)), []
 
-        result = [to_dict(order) for order in orders]
         return 200, "ok", result
 
     @staticmethod
     def query_one_order(
-        user_id: str, password: str, order_id: str
+        user_id: str, password: str, order_id: str, with_titles: bool = False
     ) -> Tuple[int, str, dict]:
-        """A buyer queries one specified order.
+        """A buyer queries one specified order with its lines as "details".
 
         Parameters
         ----------
@@ -455,33 +660,77 @@ class BuyerAPI:
         order_id : str
             the order_id of the queried order.
 
+        with_titles : bool
+            Whether to include the title of the book in each line.
+
         Returns
         -------
         (code : int, msg : str, order : dict)
             The return status and the queried order.
         """
         try:
-            session = get_session()
-            result = session.query(User).filter(User.id == user_id).first()
-            if result is None:
-                session.close()
-                return error.error_non_exist_user_id(user_id) + ({},)
-
-            if result.password != password:
-                session.close()
-                return error.error_authorization_fail() + ({},)
-
-            order = session.query(Order).filter(Order.id == order_id).first()
-            if order is None:
-                session.close()
-                return error.error_non_exist_order_id(order_id) + ({},)
-            session.close()
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message, {}
+
+                # the order and its lines in one query, an order of another
+                # buyer is reported as not existing, like in query_orders
+                orders = query_orders_with_details(
+                    session, [order_id], buyer=user_id, with_titles=with_titles
+                )
+                if not orders:
+                    return error.error_non_exist_order_id(order_id) + ({},)
         except SQLAlchemyError as e:
             logging.error(e)
-            session.close()
             return 528, "{}".format(str(e)), {}
         except BaseException as e:
             logging.error(e)
-            session.close()
             return 530, "{}".format(str(e)), {}
-        return 200, "ok", to_dict(order)
+        return 200, "ok", orders[0]
+
+    @staticmethod
+    def query_orders(
+        user_id: str, password: str, order_ids: List[str], with_titles: bool = False
+    ) -> Tuple[int, str, list]:
+        """A buyer queries many orders with their lines, in one query.
+
+        Parameters
+        ----------
+        user_id : str
+            The user_id of the buyer.
+
+        password : str
+            The password of the buyer.
+
+        order_ids : List[str]
+            The order_ids of the queried orders. Those not existing or not of
+            this buyer are left out of the result.
+
+        with_titles : bool
+            Whether to include the title of the book in each line.
+
+        Returns
+        -------
+        (code : int, msg : str, orders : List[dict])
+            The return status and the queried orders, in the order of order_ids.
+        """
+        try:
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message, []
+
+                if not isinstance(order_ids, list):
+                    return error.error_invalid_query_order_behaviour() + ([],)
+
+                orders = query_orders_with_details(
+                    session, order_ids, buyer=user_id, with_titles=with_titles
+                )
+        except SQLAlchemyError as e:
+            logging.error(e)
+            return 528, "{}".format(str(e)), []
+        except BaseException as e:
+            logging.error(e)
+            return 530, "{}".format(str(e)), []
+        return 200, "ok", orders
@@ -15,7 +15,7 @@ error_code = {
     523: "the user is not match {},{}",
     524: "the store is not match {},{}",
     525: "invalid behaviour in query book API",
-    526: "",
+    526: "invalid behaviour in query order API",
     527: "",
     528: "",
 }
@@ -81,6 +81,10 @@ def error_invalid_query_book_behaviour():
     return 525, error_code[525].format()
 
 
+def error_invalid_query_order_behaviour():
+    return 526, error_code[526].format()
+
+
 def error_authorization_fail():
     return 401, error_code[401]
 
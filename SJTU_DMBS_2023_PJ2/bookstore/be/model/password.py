@@ -0,0 +1,123 @@
+"""Password hashing.
+
+Passwords are stored as "scrypt$<n>$<r>$<p>$<salt>$<hash>". Rows written before
+hashing was introduced still hold the plaintext, they are accepted and rehashed
+on the next login.
+
+Hashing and verification are CPU bound by design, so they run in a bounded pool
+of worker processes instead of the request threads. This module only imports
+the standard library and the config, so that the spawned workers start fast.
+"""
+
+import os
+import hmac
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from be import conf
+
+SCHEME = "scrypt"
+SALT_LEN = 16
+HASH_LEN = 32
+
+
+def scrypt_maxmem(n: int, r: int, p: int) -> int:
+    """The memory limit for scrypt with these parameters.
+
+    scrypt uses 128 * r * (n + p + 2) bytes. A margin of 1 MB is added for the
+    allocations of the implementation.
+    """
+    return 128 * r * (n + p + 2) + 2**20
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with a random salt."""
+    n, r, p = conf.SCRYPT_N, conf.SCRYPT_R, conf.SCRYPT_P
+    salt = os.urandom(SALT_LEN)
+    digest = hashlib.scrypt(
+        password.encode("utf-8"),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=scrypt_maxmem(n, r, p),
+        dklen=HASH_LEN,
+    )
+    return "$".join([SCHEME, str(n), str(r), str(p), salt.hex(), digest.hex()])
+
+
+def is_hashed(stored: str) -> bool:
+    """Whether the stored password is hashed, or a legacy plaintext."""
+    parts = stored.split("$")
+    return len(parts) == 6 and parts[0] == SCHEME
+
+
+def check_password_hash(password: str, stored: str) -> bool:
+    """Whether the password matches the stored one, hashed or legacy plaintext."""
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+
+    _, n, r, p, salt, expected = stored.split("$")
+    n, r, p = int(n), int(r), int(p)
+    digest = hashlib.scrypt(
+        password.encode("utf-8"),
+        salt=bytes.fromhex(salt),
+        n=n,
+        r=r,
+        p=p,
+        maxmem=scrypt_maxmem(n, r, p),
+        dklen=len(expected) // 2,
+    )
+    return hmac.compare_digest(digest, bytes.fromhex(expected))
+
+
+class PasswordHasher:
+    """Run hashing and verification in a pool of worker processes.
+
+    At most `max_pending` jobs are submitted at a time, the other callers wait,
+    so that a burst of logins can not pile up an unbounded queue. With no worker
+    processes, the jobs run in the calling thread.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self.lock = threading.Lock()
+        self._executor: ProcessPoolExecutor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # created lazily, so that it is never inherited by forked server workers
+        with self.lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        with self.slots:
+            return self._get_executor().submit(func, *args).result()
+
+    def hash(self, password: str) -> str:
+        return self._run(hash_password, password)
+
+    def verify(self, password: str, stored: str) -> bool:
+        if not is_hashed(stored):
+            # a plaintext comparison is cheap
+            return check_password_hash(password, stored)
+        return self._run(check_password_hash, password, stored)
+
+    def shutdown(self):
+        with self.lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+# global instance of the hasher of this process
+hasher = PasswordHasher(conf.PASSWORD_WORKERS, conf.PASSWORD_MAX_PENDING)
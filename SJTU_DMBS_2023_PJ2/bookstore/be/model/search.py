@@ -2,22 +2,100 @@
 
 from typing import Tuple
 
+import json
 import logging
 
-from be.model.base import get_session, Book
+from be.model.base import session_scope, BookInfo, StoreInventory, TS_CONFIG
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.exc import SQLAlchemyError
 from be.model.error import error_invalid_query_book_behaviour
-from be.model.utils import to_dict, serialize_dict
+from be.model.utils import serialize_dict, stream_rows, STOCK_LEVEL
+
+# keys of query_book to control the result pages, not restrictions of books
+PAGE_KEYS = ("limit", "page", "after", "after_store_id", "fields")
+
+# columns of a listing returned by query_book, the book info comes from the
+# catalogue and the rest from the inventory of the store.
+# The search vector is only for indexing.
+RESULT_COLUMNS = {
+    column.name: getattr(BookInfo, column.name)
+    for column in BookInfo.__table__.columns
+    if column.name != "search_vector"
+}
+RESULT_COLUMNS.update(
+    store_id=StoreInventory.store_id,
+    stock_level=STOCK_LEVEL,
+    price=StoreInventory.price,
+)
+
+
+def listings(*columns):
+    """Select the columns of books sold in stores."""
+    return (
+        select(*columns)
+        .select_from(StoreInventory)
+        .join(BookInfo, BookInfo.id == StoreInventory.book_id)
+    )
+
+
+def ts_query(keyword: str):
+    """The full-text search query of the keywords, all of them must match."""
+    return func.plainto_tsquery(TS_CONFIG, keyword)
 
 
 class SearchAPI:
     @staticmethod
-    def query_book(**kwargs) -> Tuple[int, str, list]:
+    def __restrict(cursor, kwargs):
+        """Apply the restrictions in kwargs to the query.
+
+        Returns None if the restrictions are invalid.
+        """
+        if "title_keyword" in kwargs:
+            if "title" in kwargs:
+                return None
+            title_keyword = kwargs.pop("title_keyword")
+            cursor = cursor.filter(
+                BookInfo.title.contains(title_keyword, autoescape=True)
+            )
+
+        if "keyword" in kwargs:
+            keyword = kwargs.pop("keyword")
+            cursor = cursor.filter(BookInfo.search_vector.op("@@")(ts_query(keyword)))
+
+        if "content_keyword" in kwargs:
+            if "content" in kwargs:
+                return None
+            content_keyword = kwargs.pop("content_keyword")
+            cursor = cursor.filter(
+                func.to_tsvector(TS_CONFIG, BookInfo.content).op("@@")(
+                    ts_query(content_keyword)
+                )
+            )
+
+        if "tag" in kwargs:
+            # tags are stored as a JSON list of strings
+            tag = json.dumps(kwargs.pop("tag"), ensure_ascii=False)
+            cursor = cursor.filter(BookInfo.tags.contains(tag, autoescape=True))
+
+        if any(key not in RESULT_COLUMNS for key in kwargs):
+            return None
+
+        kwargs = serialize_dict(kwargs)
+        for key, value in kwargs.items():
+            cursor = cursor.filter(RESULT_COLUMNS[key] == value)
+        return cursor
+
+    @staticmethod
+    def query_book(stream: bool = False, **kwargs) -> Tuple[int, str, list]:
         """
         Query books
 
         Parameters
         ----------
+        stream : bool
+            Whether to return the books as an iterator, which fetches them
+            batch by batch while it is consumed in the same request.
+
         kwargs : dict
             The restriction of this query.
 
@@ -39,7 +117,18 @@ class SearchAPI:
                 book_intro
                 content
                 currency_unit
-                title_keyword
+                title_keyword : a substring of the title
+                keyword : words in the title, tags, book_intro or content,
+                          the results are ranked by relevance
+                content_keyword : words in the content
+                tag : one of the tags
+
+            And the keys to control the result pages:
+                limit : the max number of books returned
+                page : the page number starting from 1, each page has `limit` books
+                after : the id of the last book in the previous page (keyset paging)
+                after_store_id : the store_id of that book, when not querying one store
+                fields : the list of columns returned, e.g. ["id", "title", "price"]
 
         Returns
         -------
@@ -47,28 +136,101 @@ class SearchAPI:
             The return status and the queried books.
         """
         try:
-            session = get_session()
-            cursor = session.query(Book)
+            with session_scope() as session:
+                limit = kwargs.pop("limit", None)
+                page = kwargs.pop("page", None)
+                after = kwargs.pop("after", None)
+                after_store_id = kwargs.pop("after_store_id", None)
+                fields = kwargs.pop("fields", None)
+
+                keyword = kwargs.get("keyword")
+
+                if page is not None and (limit is None or page < 1):
+                    return error_invalid_query_book_behaviour() + ([],)
+                # keyset paging does not fit the order of relevance
+                if keyword is not None and after is not None:
+                    return error_invalid_query_book_behaviour() + ([],)
 
-            if "title_keyword" in kwargs:
-                if "title" in kwargs:
+                if fields is None:
+                    fields = list(RESULT_COLUMNS)
+                if not fields or any(field not in RESULT_COLUMNS for field in fields):
                     return error_invalid_query_book_behaviour() + ([],)
-                title_keyword = kwargs.pop("title_keyword")
-                cursor = cursor.filter(Book.title.like(f"%{title_keyword}%"))
+                cursor = listings(*[RESULT_COLUMNS[field] for field in fields])
 
-            if kwargs:
-                kwargs = serialize_dict(kwargs)
-                cursor = cursor.filter_by(**kwargs)
+                cursor = SearchAPI.__restrict(cursor, kwargs)
+                if cursor is None:
+                    return error_invalid_query_book_behaviour() + ([],)
+
+                if keyword is not None:
+                    cursor = cursor.order_by(
+                        func.ts_rank(BookInfo.search_vector, ts_query(keyword)).desc(),
+                        StoreInventory.book_id,
+                        StoreInventory.store_id,
+                    )
+                elif limit is not None or after is not None:
+                    # a stable order is needed to cut pages
+                    cursor = cursor.order_by(
+                        StoreInventory.book_id, StoreInventory.store_id
+                    )
+                if after is not None:
+                    if after_store_id is not None:
+                        cursor = cursor.filter(
+                            tuple_(StoreInventory.book_id, StoreInventory.store_id)
+                            > (after, after_store_id)
+                        )
+                    else:
+                        cursor = cursor.filter(StoreInventory.book_id > after)
+                if page is not None:
+                    cursor = cursor.offset((page - 1) * limit)
+                if limit is not None:
+                    cursor = cursor.limit(limit)
+
+                if stream:
+                    books = (dict(zip(fields, row)) for row in stream_rows(cursor))
+                    return 200, "ok", books
 
-            books = cursor.all()
-            session.close()
-            ret = [to_dict(book) for book in books]
+                # plain rows zipped with the requested fields, no ORM objects
+                rows = session.execute(cursor).all()
+                ret = [dict(zip(fields, row)) for row in rows]
         except SQLAlchemyError as e:
             logging.error(e)
-            session.close()
             return 528, "{}".format(str(e)), None
         except BaseException as e:
             logging.error(e)
-            session.close()
             return 530, "{}".format(str(e)), None
         return 200, "ok", ret
+
+    @staticmethod
+    def count_book(**kwargs) -> Tuple[int, str, int]:
+        """
+        Count the books matching the restriction, ignoring the page keys.
+
+        Parameters
+        ----------
+        kwargs : dict
+            The restriction of this query. The same as `query_book`.
+
+        Returns
+        -------
+        (code : int, msg : str, total: int)
+            The return status and the number of matched books.
+        """
+        try:
+            with session_scope() as session:
+                for key in PAGE_KEYS:
+                    kwargs.pop(key, None)
+
+                cursor = SearchAPI.__restrict(listings(StoreInventory.book_id), kwargs)
+                if cursor is None:
+                    return error_invalid_query_book_behaviour() + (0,)
+
+                total = session.execute(
+                    select(func.count()).select_from(cursor.subquery())
+                ).scalar()
+        except SQLAlchemyError as e:
+            logging.error(e)
+            return 528, "{}".format(str(e)), 0
+        except BaseException as e:
+            logging.error(e)
+            return 530, "{}".format(str(e)), 0
+        return 200, "ok", total
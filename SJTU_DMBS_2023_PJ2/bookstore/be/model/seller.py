@@ -1,19 +1,45 @@
 """Seller related APIs."""
 
-from typing import Tuple
+from typing import Iterable, List, Tuple
 
 import logging
+from be import conf
 from be.model import error
-from be.model.base import get_session, Book, Store, Order
+from be.model.base import session_scope, BookInfo, StoreInventory, Store, Order
 from be.model.utils import (
     user_id_exists,
     store_id_exists,
     book_id_exists,
     serialize_dict,
+    valid_order_page,
+    query_order_history,
+    transition_order,
+    order_transition_failure,
+    add_sharded_stock,
+    reshard_stock,
 )
+from be.model.auth_cache import verify_password
 
+from sqlalchemy import Integer
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
+# columns of the catalogue given by the sellers, the search vector is computed
+BOOK_INFO_COLUMNS = [
+    column.name for column in BookInfo.__table__.columns if not column.computed
+]
+# the columns each book of add_books must give, and those holding integers
+REQUIRED_BOOK_INFO_COLUMNS = [
+    column.name
+    for column in BookInfo.__table__.columns
+    if not column.computed and not column.nullable
+]
+INTEGER_BOOK_INFO_COLUMNS = [
+    column.name
+    for column in BookInfo.__table__.columns
+    if isinstance(column.type, Integer)
+]
+
 
 class SellerAPI:
     """Backend APIs related to seller manipulation."""
@@ -51,35 +77,174 @@ class SellerAPI:
             The return status.
         """
         try:
-            if not user_id_exists(user_id):
-                return error.error_non_exist_user_id(user_id)
-            if not store_id_exists(store_id):
-                return error.error_non_exist_store_id(store_id)
-
-            session = get_session()
-            assert book_info.pop("id") == book_id
-            book_info = serialize_dict(book_info)
-            # print("BI: ", book_info["title"])
-            book = Book(
-                id=book_id, store_id=store_id, stock_level=stock_level, **book_info
-            )
-            session.add(book)
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                if not user_id_exists(user_id):
+                    return error.error_non_exist_user_id(user_id)
+                if not store_id_exists(store_id):
+                    return error.error_non_exist_store_id(store_id)
+
+                assert book_info.pop("id") == book_id
+                book_info = serialize_dict(book_info)
+                # The catalogue row is shared by all stores selling this book, the
+                # first store adding the book creates it.
+                session.execute(
+                    insert(BookInfo)
+                    .values(id=book_id, **book_info)
+                    .on_conflict_do_nothing(index_elements=[BookInfo.id])
+                )
+                session.add(
+                    StoreInventory(
+                        store_id=store_id,
+                        book_id=book_id,
+                        stock_level=stock_level,
+                        price=book_info["price"],
+                    )
+                )
+                session.commit()
 
         except IntegrityError:
             return error.error_exist_book_id(book_id)
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
 
+    @staticmethod
+    def add_books(
+        user_id: str,
+        store_id: str,
+        books: Iterable[dict],
+        batch_size: int = conf.ADD_BOOKS_BATCH_SIZE,
+    ) -> Tuple[int, str, List[dict]]:
+        """Add many books to a store.
+
+        The books are inserted in batches, each batch by one statement for the
+        catalogue and one for the inventory, and committed on its own.
+
+        Parameters
+        ----------
+        user_id : str
+            The user_id of the seller.
+
+        store_id : str
+            The store_id of the store.
+
+        books : Iterable[dict]
+            The books as {"book_info": dict, "stock_level": int}. It can be a
+            lazy iterator, it is consumed batch by batch.
+
+        batch_size : int
+            The number of books in a batch.
+
+        Returns
+        -------
+        (code : int, msg : str, results : List[dict])
+            The return status, and the status of each book as
+            {"book_id": str, "code": int, "message": str}. After an error of
+            the database, the books of the failed and later batches are left out.
+        """
+        results = []
+        try:
+            with session_scope() as session:
+                if not user_id_exists(user_id):
+                    return error.error_non_exist_user_id(user_id) + ([],)
+                if not store_id_exists(store_id):
+                    return error.error_non_exist_store_id(store_id) + ([],)
+
+                batch = []
+                for item in books:
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        results += SellerAPI.__add_book_batch(session, store_id, batch)
+                        batch = []
+                if batch:
+                    results += SellerAPI.__add_book_batch(session, store_id, batch)
+
+        except SQLAlchemyError as e:
+            logging.info("528, {}".format(str(e)))
+            return 528, "{}".format(str(e)), results
+        except BaseException as e:
+            logging.info("530, {}".format(str(e)))
+            return 530, "{}".format(str(e)), results
+
+        return 200, "ok", results
+
+    @staticmethod
+    def __add_book_batch(session, store_id: str, items: List[dict]) -> List[dict]:
+        """Insert a batch of books and commit, returns the status of each book."""
+        statuses = [None] * len(items)
+        book_ids = [None] * len(items)
+        book_rows = []
+        inventory_rows = []
+        for i, item in enumerate(items):
+            book_info = item.get("book_info") if isinstance(item, dict) else None
+            book_id = book_info.get("id") if isinstance(book_info, dict) else None
+            stock_level = item.get("stock_level", 0) if book_id is not None else None
+            if isinstance(book_id, str):
+                book_ids[i] = book_id
+            # A book failing the constraints of the tables is rejected here,
+            # otherwise its error would abort the whole batch.
+            if (
+                book_ids[i] is None
+                or not isinstance(stock_level, int)
+                or any(key not in BOOK_INFO_COLUMNS for key in book_info)
+                or any(name not in book_info for name in REQUIRED_BOOK_INFO_COLUMNS)
+                or any(
+                    not isinstance(book_info[name], int)
+                    for name in INTEGER_BOOK_INFO_COLUMNS
+                    if name in book_info
+                )
+            ):
+                statuses[i] = error.error_and_message(530, "invalid book info")
+                continue
+
+            book_info = serialize_dict(dict(book_info))
+            book_rows.append({name: book_info.get(name) for name in BOOK_INFO_COLUMNS})
+            inventory_rows.append(
+                {
+                    "store_id": store_id,
+                    "book_id": book_id,
+                    "stock_level": stock_level,
+                    "price": book_info.get("price"),
+                }
+            )
+
+        added = set()
+        if book_rows:
+            # the catalogue rows may exist already, added by other stores
+            session.execute(
+                insert(BookInfo).on_conflict_do_nothing(index_elements=[BookInfo.id]),
+                book_rows,
+            )
+            added = set(
+                session.execute(
+                    insert(StoreInventory)
+                    .values(inventory_rows)
+                    .on_conflict_do_nothing(
+                        index_elements=[StoreInventory.store_id, StoreInventory.book_id]
+                    )
+                    .returning(StoreInventory.book_id)
+                ).scalars()
+            )
+        session.commit()
+
+        results = []
+        for book_id, status in zip(book_ids, statuses):
+            if status is not None:
+                code, message = status
+            elif book_id in added:
+                # a book repeated in the batch is added once
+                added.remove(book_id)
+                code, message = 200, "ok"
+            else:
+                code, message = error.error_exist_book_id(book_id)
+            results.append({"book_id": book_id, "code": code, "message": message})
+        return results
+
     @staticmethod
     def add_stock_level(
         user_id: str, store_id: str, book_id: str, add_stock_level: int
@@ -106,31 +271,92 @@ class SellerAPI:
             The return status.
         """
         try:
-            if not user_id_exists(user_id):
-                return error.error_non_exist_user_id(user_id)
-            if not store_id_exists(store_id):
-                return error.error_non_exist_store_id(store_id)
-            if not book_id_exists(book_id):
-                return error.error_non_exist_book_id(book_id)
-
-            session = get_session()
-            session.query(Book).filter_by(id=book_id, store_id=store_id).update(
-                {
-                    "stock_level": Book.stock_level + add_stock_level,
-                },
-            )
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                if not user_id_exists(user_id):
+                    return error.error_non_exist_user_id(user_id)
+                if not store_id_exists(store_id):
+                    return error.error_non_exist_store_id(store_id)
+                if not book_id_exists(book_id):
+                    return error.error_non_exist_book_id(book_id)
+
+                updated = (
+                    session.query(StoreInventory)
+                    .filter_by(book_id=book_id, store_id=store_id, shards=0)
+                    .update(
+                        {
+                            "stock_level": StoreInventory.stock_level + add_stock_level,
+                        },
+                    )
+                )
+                if updated == 0 and not add_sharded_stock(
+                    session, store_id, book_id, add_stock_level
+                ):
+                    # the book is in the catalogue but not sold in this store
+                    session.rollback()
+                    return error.error_non_exist_book_id(book_id)
+                session.commit()
 
         except IntegrityError:
             return error.error_non_exist_book_id(book_id)
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
+            return 530, "{}".format(str(e))
+
+        return 200, "ok"
+
+    @staticmethod
+    def set_stock_shards(
+        user_id: str, store_id: str, book_id: str, shards: int
+    ) -> Tuple[int, str]:
+        """Split the stock of a book in a store into shards, or merge it back.
+
+        A hot book is sharded, so that concurrent orders reserve it from
+        different rows. Other books keep their stock in the inventory row.
+
+        Parameters
+        ----------
+        user_id : str
+            The user_id of the seller.
+
+        store_id : str
+            The store_id of the store.
+
+        book_id : str
+            The book_id of the book.
+
+        shards : int
+            The number of shards, up to `conf.MAX_STOCK_SHARDS`. 0 to keep the
+            stock in the inventory row.
+
+        Returns
+        -------
+        (code : int, msg : str)
+            The return status.
+        """
+        if (
+            not isinstance(shards, int)
+            or isinstance(shards, bool)
+            or not 0 <= shards <= conf.MAX_STOCK_SHARDS
+        ):
+            return error.error_and_message(530, "invalid shard count")
+        try:
+            with session_scope() as session:
+                if not user_id_exists(user_id):
+                    return error.error_non_exist_user_id(user_id)
+                if not store_id_exists(store_id):
+                    return error.error_non_exist_store_id(store_id)
+
+                if not reshard_stock(session, store_id, book_id, shards):
+                    return error.error_non_exist_book_id(book_id)
+                session.commit()
+        except SQLAlchemyError as e:
+            logging.info("528, {}".format(str(e)))
+            return 528, "{}".format(str(e))
+        except BaseException as e:
+            logging.info("530, {}".format(str(e)))
             return 530, "{}".format(str(e))
 
         return 200, "ok"
@@ -153,24 +379,21 @@ class SellerAPI:
             The return status.
         """
         try:
-            if not user_id_exists(user_id):
-                return error.error_non_exist_user_id(user_id)
+            with session_scope() as session:
+                if not user_id_exists(user_id):
+                    return error.error_non_exist_user_id(user_id)
 
-            session = get_session()
-            store = Store(id=store_id, owner=user_id)
-            session.add(store)
-            session.commit()
-            session.close()
+                store = Store(id=store_id, owner=user_id)
+                session.add(store)
+                session.commit()
 
         except IntegrityError:
             return error.error_exist_store_id(store_id)
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
@@ -193,36 +416,89 @@ class SellerAPI:
             The return status.
         """
         try:
-            if not store_id_exists(store_id):
-                return error.error_non_exist_store_id(store_id)
+            with session_scope() as session:
+                # mark the order delivered, if it is a paid order of the store
+                result = transition_order(
+                    session, order_id, "paid", "delivered", Order.store_id == store_id
+                )
+                if result is None:
+                    if not store_id_exists(store_id):
+                        return error.error_non_exist_store_id(store_id)
+                    return order_transition_failure(
+                        session, order_id, "paid", store_id=store_id
+                    )
+                session.commit()
+        except SQLAlchemyError as e:
+            logging.info("528, {}".format(str(e)))
+            return 528, "{}".format(str(e))
+        except BaseException as e:
+            logging.info("530, {}".format(str(e)))
+            return 530, "{}".format(str(e))
 
-            session = get_session()
-            cursor = session.query(Order).filter(Order.id == order_id)
-            result = cursor.first()
+        return 200, "ok"
 
-            if result is None:
-                session.close()
-                return error.error_non_exist_order_id(order_id)
+    @staticmethod
+    def query_store_orders(
+        user_id: str,
+        password: str,
+        store_id: str,
+        limit: int = None,
+        before_timestamp: float = None,
+        status: str = None,
+        with_details: bool = False,
+        with_titles: bool = False,
+    ) -> Tuple[int, str, list]:
+        """The owner of a store queries the orders of the store, newest first.
 
-            if result.status != "paid":
-                session.close()
-                return error.error_order_status(result.status)
+        Parameters
+        ----------
+        user_id : str
+            The user_id of the owner.
 
-            if result.store_id != store_id:
-                session.close()
-                return error.error_store_id_match(result.store_id, store_id)
+        password : str
+            The password of the owner.
 
-            # update the order status
-            cursor.update({"status": "delivered"})
-            session.commit()
-            session.close()
+        store_id : str
+            The store_id of the store.
+
+        limit, before_timestamp, status, with_details, with_titles :
+            The same as `BuyerAPI.query_all_orders`.
+
+        Returns
+        -------
+        (code : int, msg : str, orders: List[dict])
+            The return status and the queried orders.
+        """
+        try:
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return code, message, []
+
+                store = session.query(Store.owner).filter(Store.id == store_id).first()
+                if store is None:
+                    return error.error_non_exist_store_id(store_id) + ([],)
+                if store.owner != user_id:
+                    return error.error_authorization_fail() + ([],)
+
+                if not valid_order_page(limit, before_timestamp, status):
+                    return error.error_invalid_query_order_behaviour() + ([],)
+
+                result = query_order_history(
+                    session,
+                    Order.store_id,
+                    store_id,
+                    limit=limit,
+                    before_timestamp=before_timestamp,
+                    status=status,
+                    with_details=with_details,
+                    with_titles=with_titles,
+                )
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
-            return 528, "{}".format(str(e))
+            return 528, "{}".format(str(e)), []
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
-            return 530, "{}".format(str(e))
+            return 530, "{}".format(str(e)), []
 
-        return 200, "ok"
+        return 200, "ok", result
@@ -0,0 +1,48 @@
+"""Background settler folding the balance journal into the users' balances."""
+
+from be import conf
+from be.model.base import session_scope
+from be.model.batch_worker import BatchWorker, start_worker, worker_stats
+from be.model.utils import settle_balances
+
+
+class BalanceSettler(BatchWorker):
+    """Fold the entries of BalanceJournal into User.balance in batches.
+
+    A batch updates each credited user once, however many orders it settles.
+    """
+
+    name = "BalanceSettler"
+    log_message = "Settler settled {} journal entries."
+    counters = ("settled_entries",)
+
+    def run_batch(self) -> int:
+        """Settle one batch of journal entries.
+
+        Returns the number of entries settled.
+        """
+        with session_scope() as session:
+            count = settle_balances(session, limit=self.batch_size)
+            if count == 0:
+                return 0
+            session.commit()
+
+        self.add_stats(settled_entries=count)
+        return count
+
+
+# global instance of the settler of this process
+settler: BalanceSettler = None
+
+
+def init_settler(
+    interval: float = conf.SETTLER_INTERVAL, batch_size: int = conf.SETTLER_BATCH_SIZE
+):
+    """Start the settler of this process, unless it is disabled or started."""
+    global settler
+    if settler is None:
+        settler = start_worker(BalanceSettler, interval, batch_size)
+
+
+def get_settler_stats() -> dict:
+    return worker_stats(settler)
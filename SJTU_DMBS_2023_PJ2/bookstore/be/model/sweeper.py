@@ -0,0 +1,67 @@
+"""Background sweeper cancelling the expired unpaid orders."""
+
+import time
+
+from sqlalchemy import select, update
+from be import conf
+from be.model.base import session_scope, Order
+from be.model.batch_worker import BatchWorker, start_worker, worker_stats
+from be.model.utils import ORDER_EXPIRED_TIME_INTERVAL, restore_stock
+
+
+class OrderSweeper(BatchWorker):
+    """Cancel the expired unpaid orders in batches and give back their stock."""
+
+    name = "OrderSweeper"
+    log_message = "Sweeper canceled {} expired orders."
+    counters = ("reclaimed_orders", "restored_rows")
+
+    def run_batch(self) -> int:
+        """Cancel one batch of expired orders.
+
+        Returns the number of orders canceled.
+        """
+        with session_scope() as session:
+            deadline = time.time() - ORDER_EXPIRED_TIME_INTERVAL
+            order_ids = (
+                session.execute(
+                    select(Order.id)
+                    .where(Order.status == "unpaid", Order.timestamp < deadline)
+                    .order_by(Order.timestamp)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                .scalars()
+                .all()
+            )
+            if not order_ids:
+                return 0
+
+            restored = restore_stock(session, order_ids)
+            session.execute(
+                update(Order)
+                .where(Order.id.in_(order_ids))
+                .values(status="canceled")
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+
+        self.add_stats(reclaimed_orders=len(order_ids), restored_rows=restored)
+        return len(order_ids)
+
+
+# global instance of the sweeper of this process
+sweeper: OrderSweeper = None
+
+
+def init_sweeper(
+    interval: float = conf.SWEEPER_INTERVAL, batch_size: int = conf.SWEEPER_BATCH_SIZE
+):
+    """Start the sweeper of this process, unless it is disabled or started."""
+    global sweeper
+    if sweeper is None:
+        sweeper = start_worker(OrderSweeper, interval, batch_size)
+
+
+def get_sweeper_stats() -> dict:
+    return worker_stats(sweeper)
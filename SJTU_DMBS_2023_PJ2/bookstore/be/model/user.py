@@ -6,7 +6,14 @@ import jwt
 import time
 import logging
 from be.model import error
-from be.model.base import get_session, User
+from be.model.base import session_scope, User
+from be.model.password import hasher
+from be.model.auth_cache import (
+    verify_password,
+    cache_token,
+    cached_token_ts,
+    invalidate_user,
+)
 
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
@@ -70,7 +77,7 @@ class UserAPI:
     token_lifetime: int = 3600  # 3600 second
 
     @staticmethod
-    def __check_token(user_id, db_token, token) -> bool:
+    def __check_token(user_id, db_token, token) -> float:
         """Check whether the token is matched in the database.
 
         Parameters
@@ -86,21 +93,21 @@ class UserAPI:
 
         Returns
         -------
-        ret : bool
-            Whether the token is valid.
+        ts : float
+            The issue time of the token if it is valid, else None.
         """
         try:
             if db_token != token:
-                return False
+                return None
             jwt_text = jwt_decode(encoded_token=token, user_id=user_id)
             ts = jwt_text["timestamp"]
             if ts is not None:
                 now = time.time()
                 if UserAPI.token_lifetime > now - ts >= 0:
-                    return True
+                    return ts
         except jwt.exceptions.InvalidSignatureError as e:
             logging.error(str(e))
-            return False
+            return None
 
     @staticmethod
     def register(user_id: str, password: str) -> Tuple[int, str]:
@@ -120,29 +127,28 @@ class UserAPI:
             The return status.
         """
         try:
-            session = get_session()
-            terminal = "terminal_{}".format(str(time.time()))
-            token = jwt_encode(user_id, terminal)
-            user = User(
-                id=user_id,
-                password=password,
-                balance=0,
-                token=token,
-                terminal=terminal,
-            )
-            session.add(user)
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                terminal = "terminal_{}".format(str(time.time()))
+                token = jwt_encode(user_id, terminal)
+                user = User(
+                    id=user_id,
+                    password=hasher.hash(password),
+                    balance=0,
+                    token=token,
+                    terminal=terminal,
+                )
+                session.add(user)
+                session.commit()
+                # an entry left by a former user of this id
+                invalidate_user(user_id)
 
         except IntegrityError:
             return error.error_exist_user_id(user_id)
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
@@ -165,25 +171,27 @@ class UserAPI:
             The return status.
         """
         try:
-            session = get_session()
-            result = session.query(User).filter(User.id == user_id).first()
-
-            if result is None:
-                session.close()
-                return error.error_authorization_fail()
-            db_token = result.token
-
-            session.close()
-
-            if not UserAPI.__check_token(user_id, db_token, token):
-                return error.error_authorization_fail()
+            with session_scope() as session:
+                # The token of the user is read on every check, so that a logout
+                # or a login handled by another process is seen at once.
+                result = session.query(User.token).filter(User.id == user_id).first()
+                if result is None or result.token != token:
+                    return error.error_authorization_fail()
+
+                # a token verified recently only needs the lifetime check
+                ts = cached_token_ts(user_id, token)
+                if ts is None:
+                    ts = UserAPI.__check_token(user_id, result.token, token)
+                    if ts is None:
+                        return error.error_authorization_fail()
+                    cache_token(user_id, token, ts)
+                elif not UserAPI.token_lifetime > time.time() - ts >= 0:
+                    return error.error_authorization_fail()
 
         except SQLAlchemyError as e:
-            session.close()
             logging.info("528, {}".format(str(e)))
             return 528, "{}".format(str(e))
         except BaseException as e:
-            session.close()
             logging.info("530, {}".format(str(e)))
             return 530, "{}".format(str(e))
 
@@ -207,23 +215,15 @@ class UserAPI:
             The return status.
         """
         try:
-            session = get_session()
-            result = session.query(User).filter(User.id == user_id).first()
-
-            if result is None:
-                session.close()
-                return error.error_authorization_fail()
-            if password != result.password:
-                session.close()
-                return error.error_authorization_fail()
+            with session_scope() as session:
+                code, message = verify_password(user_id, password)
+                if code != 200:
+                    return error.error_authorization_fail()
 
-            session.close()
         except SQLAlchemyError as e:
-            session.close()
             logging.info("528, {}".format(str(e)))
             return 528, "{}".format(str(e))
         except BaseException as e:
-            session.close()
             logging.info("530, {}".format(str(e)))
             return 530, "{}".format(str(e))
 
@@ -251,25 +251,24 @@ class UserAPI:
         """
         token = ""
         try:
-            code, message = UserAPI.check_password(user_id, password)
-            if code != 200:
-                return code, message, ""
-
-            session = get_session()
-            token = jwt_encode(user_id, terminal)
-            session.query(User).filter(User.id == user_id).update(
-                {"token": token, "terminal": terminal},
-            )
-
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                # a legacy plaintext password is rehashed in this transaction
+                code, message = verify_password(user_id, password, rehash=True)
+                if code != 200:
+                    return error.error_authorization_fail() + ("",)
+
+                token = jwt_encode(user_id, terminal)
+                session.query(User).filter(User.id == user_id).update(
+                    {"token": token, "terminal": terminal},
+                )
+
+                session.commit()
+                cache_token(user_id, token, jwt_decode(token, user_id)["timestamp"])
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e)), ""
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
             return 530, "{}".format(str(e)), ""
 
         return 200, "ok", token
@@ -292,25 +291,23 @@ class UserAPI:
             The return status.
         """
         try:
-            code, message = UserAPI.check_token(user_id, token)
-            if code != 200:
-                return code, message
-
-            session = get_session()
-            terminal = "terminal_{}".format(str(time.time()))
-            dummy_token = jwt_encode(user_id, terminal)
-            session.query(User).filter(User.id == user_id).update(
-                {"token": dummy_token, "terminal": terminal},
-            )
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                code, message = UserAPI.check_token(user_id, token)
+                if code != 200:
+                    return code, message
+
+                terminal = "terminal_{}".format(str(time.time()))
+                dummy_token = jwt_encode(user_id, terminal)
+                session.query(User).filter(User.id == user_id).update(
+                    {"token": dummy_token, "terminal": terminal},
+                )
+                session.commit()
+                invalidate_user(user_id)
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
@@ -333,21 +330,19 @@ class UserAPI:
             The return status.
         """
         try:
-            code, message = UserAPI.check_password(user_id, password)
-            if code != 200:
-                return code, message
-
-            session = get_session()
-            session.query(User).filter(User.id == user_id).delete()
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                code, message = UserAPI.check_password(user_id, password)
+                if code != 200:
+                    return code, message
+
+                session.query(User).filter(User.id == user_id).delete()
+                session.commit()
+                invalidate_user(user_id)
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
@@ -375,29 +370,27 @@ class UserAPI:
             The return status.
         """
         try:
-            code, message = UserAPI.check_password(user_id, old_password)
-            if code != 200:
-                return code, message
-
-            session = get_session()
-            terminal = "terminal_{}".format(str(time.time()))
-            token = jwt_encode(user_id, terminal)
-            session.query(User).filter(User.id == user_id).update(
-                {
-                    "password": new_password,
-                    "token": token,
-                    "terminal": terminal,
-                },
-            )
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                code, message = UserAPI.check_password(user_id, old_password)
+                if code != 200:
+                    return code, message
+
+                terminal = "terminal_{}".format(str(time.time()))
+                token = jwt_encode(user_id, terminal)
+                session.query(User).filter(User.id == user_id).update(
+                    {
+                        "password": hasher.hash(new_password),
+                        "token": token,
+                        "terminal": terminal,
+                    },
+                )
+                session.commit()
+                invalidate_user(user_id)
         except SQLAlchemyError as e:
             logging.info("528, {}".format(str(e)))
-            session.rollback()
             return 528, "{}".format(str(e))
         except BaseException as e:
             logging.info("530, {}".format(str(e)))
-            session.rollback()
             return 530, "{}".format(str(e))
 
         return 200, "ok"
@@ -1,8 +1,34 @@
 import time
 import json
+import logging
 
-from sqlalchemy import exists
-from be.model.base import get_session, User, Book, Order, Store
+from sqlalchemy import (
+    bindparam,
+    case,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from be import conf
+from be.model import error
+from be.model.base import (
+    get_session,
+    session_scope,
+    User,
+    BookInfo,
+    Order,
+    OrderDetail,
+    Store,
+    StoreInventory,
+    StockShard,
+    BalanceJournal,
+)
 
 ORDER_EXPIRED_TIME_INTERVAL = 10
 
@@ -15,44 +41,609 @@ def check_expired(timestamp: float) -> bool:
     return False
 
 
-def to_dict(model):
-    """ORM Model -> dict"""
-    return {c.name: getattr(model, c.name) for c in model.__table__.columns}
-
-
 def serialize_dict(data_dict):
     for key in data_dict:
         if not isinstance(data_dict[key], str) and not isinstance(data_dict[key], int):
-            data_dict[key] = json.dumps(data_dict[key])
+            # keep non-ASCII text readable, so that it can be searched
+            data_dict[key] = json.dumps(data_dict[key], ensure_ascii=False)
     return data_dict
 
 
-"""APIs to check id existence."""
+def restore_stock(session, order_ids: list) -> int:
+    """Give back the stock reserved by the orders, in one statement.
+
+    The lines of all the orders are aggregated by (store_id, book_id) first, so
+    that each inventory row is updated once. The caller commits the session.
+
+    Returns the number of inventory rows updated.
+    """
+    reserved = (
+        select(
+            Order.store_id,
+            OrderDetail.book_id,
+            func.sum(OrderDetail.count).label("count"),
+        )
+        .join(Order, Order.id == OrderDetail.order_id)
+        .where(OrderDetail.order_id.in_(order_ids))
+        .group_by(Order.store_id, OrderDetail.book_id)
+        .subquery("reserved")
+    )
+    cursor = session.execute(
+        update(StoreInventory)
+        .where(
+            StoreInventory.store_id == reserved.c.store_id,
+            StoreInventory.book_id == reserved.c.book_id,
+        )
+        .values(stock_level=StoreInventory.stock_level + reserved.c.count)
+        .execution_options(synchronize_session=False)
+    )
+    return cursor.rowcount
+
+
+# The stock of a book in a store: the inventory row, plus the shards of a sharded
+# book. The shards are only summed for the sharded books.
+STOCK_LEVEL = case(
+    (StoreInventory.shards == 0, StoreInventory.stock_level),
+    else_=StoreInventory.stock_level
+    + select(func.coalesce(func.sum(StockShard.stock_level), 0))
+    .where(
+        StockShard.store_id == StoreInventory.store_id,
+        StockShard.book_id == StoreInventory.book_id,
+    )
+    .correlate(StoreInventory)
+    .scalar_subquery(),
+).label("stock_level")
+
+
+def reserve_sharded_stock(
+    session: Session, store_id: str, book_id: str, count: int
+) -> bool:
+    """Take `count` books from the stock of a sharded book.
+
+    A random shard with enough stock and not locked by another transaction is
+    updated, so that concurrent orders of the book update different rows. If
+    there is none, the stock of all the shards and of the inventory row is
+    gathered, waiting for their locks. The caller commits the session.
+
+    Returns whether the stock is sufficient.
+    """
+    key = (StockShard.store_id == store_id, StockShard.book_id == book_id)
+    shard = (
+        select(StockShard.shard)
+        .where(*key, StockShard.stock_level >= count)
+        .order_by(func.random())
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    cursor = session.execute(
+        update(StockShard)
+        .where(*key, StockShard.shard == shard, StockShard.stock_level >= count)
+        .values(stock_level=StockShard.stock_level - count)
+        .execution_options(synchronize_session=False)
+    )
+    if cursor.rowcount > 0:
+        return True
+
+    # Slow path: lock the inventory row, then the shards in their order.
+    base = session.execute(
+        select(StoreInventory.stock_level)
+        .where(StoreInventory.store_id == store_id, StoreInventory.book_id == book_id)
+        .with_for_update()
+    ).scalar()
+    shards = session.execute(
+        select(StockShard.shard, StockShard.stock_level)
+        .where(*key)
+        .order_by(StockShard.shard)
+        .with_for_update()
+    ).all()
+    if base is None or base + sum(level for _, level in shards) < count:
+        return False
+
+    # take the stock given back to the inventory row first
+    taken = min(max(base, 0), count)
+    if taken > 0:
+        session.execute(
+            update(StoreInventory)
+            .where(
+                StoreInventory.store_id == store_id, StoreInventory.book_id == book_id
+            )
+            .values(stock_level=StoreInventory.stock_level - taken)
+            .execution_options(synchronize_session=False)
+        )
+    remaining = count - taken
+    takes = []
+    for number, level in shards:
+        if remaining == 0:
+            break
+        taken = min(max(level, 0), remaining)
+        if taken > 0:
+            takes.append({"number": number, "taken": taken})
+            remaining -= taken
+    if takes:
+        table = StockShard.__table__
+        session.execute(
+            update(table)
+            .where(
+                table.c.store_id == store_id,
+                table.c.book_id == book_id,
+                table.c.shard == bindparam("number"),
+            )
+            .values(stock_level=table.c.stock_level - bindparam("taken")),
+            takes,
+        )
+    return True
+
+
+def spread(total: int, shards: int) -> list:
+    """Split a number of books into `shards` parts differing by one at most."""
+    return [total // shards + (1 if i < total % shards else 0) for i in range(shards)]
+
+
+def add_sharded_stock(
+    session: Session, store_id: str, book_id: str, count: int
+) -> bool:
+    """Add `count` books to the stock of a sharded book, spread over its shards.
+
+    The inventory row is locked in share mode, so that the shards are not
+    changed meanwhile. The caller commits the session.
+
+    Returns False if the store does not sell the book.
+    """
+    where = (StoreInventory.store_id == store_id, StoreInventory.book_id == book_id)
+    shards = session.execute(
+        select(StoreInventory.shards).where(*where).with_for_update(read=True)
+    ).scalar()
+    if shards is None:
+        return False
+    if shards == 0:
+        # not sharded anymore
+        session.execute(
+            update(StoreInventory)
+            .where(*where)
+            .values(stock_level=StoreInventory.stock_level + count)
+            .execution_options(synchronize_session=False)
+        )
+        return True
+    adds = [
+        {"number": number, "added": added}
+        for number, added in enumerate(spread(count, shards))
+        if added != 0
+    ]
+    if not adds:
+        return True
+    table = StockShard.__table__
+    session.execute(
+        update(table)
+        .where(
+            table.c.store_id == store_id,
+            table.c.book_id == book_id,
+            table.c.shard == bindparam("number"),
+        )
+        .values(stock_level=table.c.stock_level + bindparam("added")),
+        adds,
+    )
+    return True
+
+
+def reshard_stock(session: Session, store_id: str, book_id: str, shards: int) -> bool:
+    """Split the stock of a book into `shards` shards, 0 to keep it in one row.
+
+    The inventory row is locked, the stock of the current shards is gathered
+    and spread over the new ones. The caller commits the session.
+
+    Returns False if the store does not sell the book.
+    """
+    where = (StoreInventory.store_id == store_id, StoreInventory.book_id == book_id)
+    base = session.execute(
+        select(StoreInventory.stock_level).where(*where).with_for_update()
+    ).scalar()
+    if base is None:
+        return False
+    gathered = session.execute(
+        delete(StockShard)
+        .where(StockShard.store_id == store_id, StockShard.book_id == book_id)
+        .returning(StockShard.stock_level)
+        .execution_options(synchronize_session=False)
+    ).scalars()
+    total = base + sum(gathered)
+
+    session.execute(
+        update(StoreInventory)
+        .where(*where)
+        .values(stock_level=total if shards == 0 else 0, shards=shards)
+        .execution_options(synchronize_session=False)
+    )
+    if shards > 0:
+        session.execute(
+            insert(StockShard),
+            [
+                {
+                    "store_id": store_id,
+                    "book_id": book_id,
+                    "shard": number,
+                    "stock_level": level,
+                }
+                for number, level in enumerate(spread(total, shards))
+            ],
+        )
+    return True
+
+
+def settle_balances(session: Session, user_id: str = None, limit: int = None) -> int:
+    """Fold entries of the balance journal into User.balance.
+
+    The entries are deleted and their sums added to the users in one
+    transaction, so that a balance read never counts an entry twice or misses
+    it. The users are updated in the order of their ids, so that concurrent
+    settlements do not deadlock. The caller commits the session.
+
+    Parameters
+    ----------
+    user_id : str
+        If given, all the entries of this user, waiting for those being settled
+        by someone else. Otherwise the oldest entries of any user, skipping the
+        locked ones.
+
+    limit : int
+        The max number of entries settled, without `user_id`.
+
+    Returns
+    -------
+    The number of entries settled.
+    """
+    batch = select(BalanceJournal.id)
+    if user_id is not None:
+        batch = batch.where(BalanceJournal.user_id == user_id).with_for_update()
+    else:
+        batch = (
+            batch.order_by(BalanceJournal.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+    entries = session.execute(
+        delete(BalanceJournal)
+        .where(BalanceJournal.id.in_(batch))
+        .returning(BalanceJournal.user_id, BalanceJournal.amount)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not entries:
+        return 0
+
+    credits = {}
+    for entry in entries:
+        credits[entry.user_id] = credits.get(entry.user_id, 0) + entry.amount
+    users = User.__table__
+    session.execute(
+        update(users)
+        .where(users.c.id == bindparam("credited"))
+        .values(balance=users.c.balance + bindparam("credit")),
+        [
+            {"credited": credited, "credit": credits[credited]}
+            for credited in sorted(credits)
+        ],
+    )
+    return len(entries)
+
+
+def current_balance(session: Session, user_id: str):
+    """The balance of a user, the stored balance plus the unsettled entries.
+
+    Read by one statement, so that a concurrent settlement is either fully
+    seen or not at all. None if the user does not exist.
+    """
+    unsettled = (
+        select(func.coalesce(func.sum(BalanceJournal.amount), 0))
+        .where(BalanceJournal.user_id == user_id)
+        .scalar_subquery()
+    )
+    return session.execute(
+        select(User.balance + unsettled).where(User.id == user_id)
+    ).scalar()
+
+
+# statuses of an order
+ORDER_STATUSES = Order.status.type.enums
+
+# statuses of an order that can still be canceled
+CANCELABLE_STATUSES = ("unpaid", "paid", "delivered")
+
+
+def transition_order(
+    session: Session, order_id: str, expected, status: str, *conditions, returning=()
+):
+    """Move an order from an `expected` status to `status` by one guarded UPDATE.
+
+    The status and the other conditions are checked by the UPDATE itself, so
+    that two concurrent transitions of an order cannot both succeed, and the
+    order is not read first. The caller commits the session.
+
+    Parameters
+    ----------
+    expected : str or tuple
+        The status, or the statuses, the order may be in.
+
+    conditions :
+        Other conditions on the order, e.g. `Order.buyer == user_id`.
+
+    returning : tuple
+        Columns of the order to return.
+
+    Returns
+    -------
+    The row of the `returning` columns and of the status before the update as
+    "previous", None if no order matched. Then `order_transition_failure`
+    tells why.
+    """
+    if isinstance(expected, str):
+        expected = (expected,)
+    stmt = update(Order)
+    if len(expected) == 1:
+        previous = literal(expected[0], Order.status.type).label("previous")
+        stmt = stmt.where(Order.id == order_id, Order.status == expected[0])
+    else:
+        # RETURNING gives the new status, so the old one is read by a CTE,
+        # which locks the order first
+        old = (
+            select(Order.id, Order.status)
+            .where(Order.id == order_id)
+            .with_for_update()
+            .cte("old")
+        )
+        previous = old.c.status.label("previous")
+        stmt = stmt.where(Order.id == old.c.id, old.c.status.in_(expected))
+    stmt = (
+        stmt.where(*conditions)
+        .values(status=status)
+        .returning(previous, *returning)
+        .execution_options(synchronize_session=False)
+    )
+    return session.execute(stmt).first()
+
+
+def order_transition_failure(
+    session: Session,
+    order_id: str,
+    expected,
+    buyer: str = None,
+    store_id: str = None,
+):
+    """Why `transition_order` matched no order. Only read on this slow path.
+
+    Returns
+    -------
+    The error of the first failed check: the order does not exist, it is not
+    in an `expected` status, or it is not an order of `buyer` or `store_id`.
+    None if the order passes them all, i.e. another condition of the caller
+    failed.
+    """
+    if isinstance(expected, str):
+        expected = (expected,)
+    order = (
+        session.query(Order.status, Order.buyer, Order.store_id)
+        .filter(Order.id == order_id)
+        .first()
+    )
+    if order is None:
+        return error.error_non_exist_order_id(order_id)
+    if order.status not in expected:
+        return error.error_order_status(order.status)
+    if buyer is not None:
+        if order.buyer is None:
+            return error.error_non_exist_user_id(buyer)
+        if order.buyer != buyer:
+            return error.error_user_id_match(order.buyer, buyer)
+    if store_id is not None and order.store_id != store_id:
+        return error.error_store_id_match(order.store_id, store_id)
+    return None
+
+
+ORDER_COLUMNS = list(Order.__table__.columns)
+
+DETAIL_COLUMNS = [OrderDetail.book_id, OrderDetail.count, OrderDetail.price]
+
+
+def join_titles(stmt):
+    """Add the titles of the books to a query of order lines."""
+    return stmt.add_columns(BookInfo.title).outerjoin(
+        BookInfo, BookInfo.id == OrderDetail.book_id
+    )
+
+
+def valid_order_page(limit, before_timestamp, status) -> bool:
+    """Whether the page arguments of an order history query are valid."""
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        return False
+    if before_timestamp is not None and not isinstance(before_timestamp, (int, float)):
+        return False
+    return status is None or status in ORDER_STATUSES
+
+
+def query_order_history(
+    session: Session,
+    owner,
+    owner_id: str,
+    limit: int = None,
+    before_timestamp: float = None,
+    status: str = None,
+    with_details: bool = False,
+    with_titles: bool = False,
+    stream: bool = False,
+):
+    """A page of the orders of a buyer or a store, newest first.
+
+    Parameters
+    ----------
+    owner : Column
+        Order.buyer or Order.store_id, both are indexed with the timestamp.
+
+    before_timestamp : float
+        Only the orders created before it, i.e. the timestamp of the last order
+        of the previous page.
+
+    with_details : bool
+        Whether to include the lines of each order, fetched by the same query.
+
+    with_titles : bool
+        Whether to include the title of the book in each line.
+
+    stream : bool
+        Whether to return an iterator fetching the orders batch by batch when
+        consumed, instead of a list.
+
+    Returns
+    -------
+    The orders as dicts, with a "details" list if `with_details`.
+    """
+    page = select(*ORDER_COLUMNS).where(owner == owner_id)
+    if status is not None:
+        page = page.where(Order.status == status)
+    if before_timestamp is not None:
+        page = page.where(Order.timestamp < before_timestamp)
+    page = page.order_by(Order.timestamp.desc(), Order.id.desc())
+    if limit is not None:
+        page = page.limit(limit)
+
+    if not with_details:
+        if stream:
+            return (row._asdict() for row in stream_rows(page))
+        return [dict(row) for row in session.execute(page).mappings()]
+
+    # cut the page first, then join its lines
+    page = page.subquery("page")
+    stmt = (
+        select(page, *DETAIL_COLUMNS)
+        .outerjoin(OrderDetail, OrderDetail.order_id == page.c.id)
+        .order_by(page.c.timestamp.desc(), page.c.id.desc())
+    )
+    if with_titles:
+        stmt = join_titles(stmt)
+    if stream:
+        # the lines of an order are adjacent in this order
+        return iter_adjacent_order_details(row._mapping for row in stream_rows(stmt))
+    return group_order_details(session.execute(stmt).mappings())
+
+
+def query_orders_with_details(
+    session: Session, order_ids: list, buyer: str = None, with_titles: bool = False
+) -> list:
+    """The orders with their lines, fetched by one query.
+
+    Parameters
+    ----------
+    order_ids : list
+        The order_ids of the orders. Those not existing are left out.
+
+    buyer : str
+        If given, only the orders of this buyer.
+
+    with_titles : bool
+        Whether to include the title of the book in each line.
+
+    Returns
+    -------
+    The orders as dicts with a "details" list, in the order of `order_ids`.
+    """
+    stmt = (
+        select(*ORDER_COLUMNS, *DETAIL_COLUMNS)
+        .outerjoin(OrderDetail, OrderDetail.order_id == Order.id)
+        .where(Order.id.in_(order_ids))
+    )
+    if buyer is not None:
+        stmt = stmt.where(Order.buyer == buyer)
+    if with_titles:
+        stmt = join_titles(stmt)
+    orders = {
+        order["id"]: order
+        for order in group_order_details(session.execute(stmt).mappings())
+    }
+    return [
+        orders[order_id] for order_id in dict.fromkeys(order_ids) if order_id in orders
+    ]
+
+
+def group_order_details(rows) -> list:
+    """Group the rows of orders joined with their lines into orders.
+
+    Each row has the order columns, and the book_id, count, price and optionally
+    title of a line, which are None for an order without lines. The order of
+    rows is kept.
+    """
+    orders = {}
+    for row in rows:
+        order = orders.get(row["id"])
+        if order is None:
+            order = _order_of_row(row)
+            orders[row["id"]] = order
+        _add_detail_of_row(order, row)
+    return list(orders.values())
+
+
+def iter_adjacent_order_details(rows):
+    """Like `group_order_details`, but lazily, for the rows where the lines of
+    each order are adjacent. Only one order is held at a time.
+    """
+    order = None
+    for row in rows:
+        if order is None or order["id"] != row["id"]:
+            if order is not None:
+                yield order
+            order = _order_of_row(row)
+        _add_detail_of_row(order, row)
+    if order is not None:
+        yield order
+
+
+def _order_of_row(row) -> dict:
+    order = {column.name: row[column.name] for column in ORDER_COLUMNS}
+    order["details"] = []
+    return order
+
+
+def _add_detail_of_row(order: dict, row):
+    if row["book_id"] is not None:
+        detail = {
+            "book_id": row["book_id"],
+            "count": row["count"],
+            "price": row["price"],
+        }
+        if "title" in row:
+            detail["title"] = row["title"]
+        order["details"].append(detail)
+
+
+def stream_rows(stmt, batch_size: int = conf.STREAM_BATCH_SIZE):
+    """Iterate over the rows of a select, fetching `batch_size` rows at a time.
+
+    The rows are read through a server-side cursor of the session of the
+    current request when the iterator is consumed, so that only one batch is
+    held in memory. The session is closed when the iteration ends.
+    """
+    try:
+        with session_scope() as session:
+            result = session.execute(stmt.execution_options(yield_per=batch_size))
+            for row in result:
+                yield row
+    except SQLAlchemyError as e:
+        # the response is already started, there is no status code to return
+        logging.error(e)
+        raise
+
+
+"""APIs to check id existence. They share the session of the current request."""
 
 
 def user_id_exists(user_id: str) -> bool:
-    session = get_session()
-    is_exists = session.query(exists().where(User.id == user_id)).scalar()
-    session.close()
-    return is_exists
+    return get_session().query(exists().where(User.id == user_id)).scalar()
 
 
 def store_id_exists(store_id: str) -> bool:
-    session = get_session()
-    is_exists = session.query(exists().where(Store.id == store_id)).scalar()
-    session.close()
-    return is_exists
+    return get_session().query(exists().where(Store.id == store_id)).scalar()
 
 
 def order_id_exists(order_id: str) -> bool:
-    session = get_session()
-    is_exists = session.query(exists().where(Order.id == order_id)).scalar()
-    session.close()
-    return is_exists
+    return get_session().query(exists().where(Order.id == order_id)).scalar()
 
 
 def book_id_exists(book_id: str) -> bool:
-    session = get_session()
-    is_exists = session.query(exists().where(Book.id == book_id)).scalar()
-    session.close()
-    return is_exists
+    return get_session().query(exists().where(BookInfo.id == book_id)).scalar()
@@ -1,23 +1,38 @@
 import logging
 import os
 import sys
+import signal
+import socket
+import threading
 from flask import Flask
 from flask import Blueprint
 from flask import request
+from werkzeug.serving import make_server
+from be import conf
 from be.view import auth
 from be.view import seller
 from be.view import buyer
 from be.view import search
-from be.model.base import init_database
+from be.view import stats
+from be.model.base import init_database, remove_session
+from be.model.sweeper import init_sweeper
+from be.model.settler import init_settler
 
 bp_shutdown = Blueprint("shutdown", __name__)
 
+# pid of the master process when serving with `be_run_workers`
+master_pid: int = None
+
 
 def shutdown_server():
     func = request.environ.get("werkzeug.server.shutdown")
-    if func is None:
+    if func is not None:
+        func()
+    elif master_pid is not None:
+        # stop the master, which stops all the workers gracefully
+        os.kill(master_pid, signal.SIGTERM)
+    else:
         raise RuntimeError("Not running with the Werkzeug Server")
-    func()
 
 
 @bp_shutdown.route("/shutdown")
@@ -26,7 +41,7 @@ def be_shutdown():
     return "Server shutting down..."
 
 
-def be_run():
+def init_logging():
     this_path = os.path.dirname(__file__)
     parent_path = os.path.dirname(this_path)
     log_file = os.path.join(parent_path, "app.log")
@@ -41,7 +56,18 @@ def be_run():
     handler.setFormatter(formatter)
     logging.getLogger().addHandler(handler)
 
-    init_database(username="postgres", password="123456", db_name="bookstore")
+
+def create_app() -> Flask:
+    """App factory.
+
+    It initializes the database engine (and its connection pool) and starts the
+    order sweeper and the balance settler of the calling process, so it must be
+    called in each worker after fork. It can also be used by an external WSGI
+    server, e.g. `gunicorn -w 4 "be.serve:create_app()"`.
+    """
+    init_database()
+    init_sweeper()
+    init_settler()
 
     app = Flask(__name__)
     app.register_blueprint(bp_shutdown)
@@ -49,4 +75,76 @@ def be_run():
     app.register_blueprint(seller.bp_seller)
     app.register_blueprint(buyer.bp_buyer)
     app.register_blueprint(search.bp_search)
-    app.run()
+    app.register_blueprint(stats.bp_stats)
+    app.teardown_appcontext(remove_session)
+    return app
+
+
+def be_run():
+    """Run the development server in this process."""
+    init_logging()
+    app = create_app()
+    app.run(host=conf.HOST, port=conf.PORT)
+
+
+def run_worker(listen_socket: socket.socket):
+    """Serve on the inherited listening socket until SIGTERM."""
+    app = create_app()
+    server = make_server(
+        conf.HOST, conf.PORT, app, threaded=True, fd=listen_socket.fileno()
+    )
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so not in this thread
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    # Ctrl-C reaches the whole process group, let the master handle it.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.info("Worker {} started.".format(os.getpid()))
+    server.serve_forever()
+    server.server_close()
+    logging.info("Worker {} stopped.".format(os.getpid()))
+
+
+def be_run_workers(workers: int = conf.WORKERS):
+    """Run the server with a prefork of worker processes.
+
+    The master binds the listening socket and forks the workers, which accept
+    on the shared socket. Each worker creates its own engine after fork. SIGTERM
+    or SIGINT on the master stops the workers gracefully.
+    """
+    global master_pid
+    init_logging()
+    master_pid = os.getpid()
+
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind((conf.HOST, conf.PORT))
+    listen_socket.listen(128)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(listen_socket)
+            finally:
+                os._exit(0)
+        children.append(pid)
+    logging.info(
+        "Serving on {}:{} with {} workers.".format(conf.HOST, conf.PORT, workers)
+    )
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+    listen_socket.close()
@@ -1,7 +1,9 @@
 from flask import Blueprint
 from flask import request
 from flask import jsonify
+from be.view.response import json_response, stream_response, STREAM_FORMATS
 from be.model.buyer import BuyerAPI
+from be.model.error import error_invalid_query_order_behaviour
 
 bp_buyer = Blueprint("buyer", __name__, url_prefix="/buyer")
 
@@ -42,6 +44,15 @@ def add_funds():
     return jsonify({"message": message}), code
 
 
+@bp_buyer.route("/query_balance", methods=["POST"])
+def query_balance():
+    user_id = request.json.get("user_id")
+    password = request.json.get("password")
+    b = BuyerAPI()
+    code, message, balance = b.query_balance(user_id, password)
+    return jsonify({"message": message, "balance": balance}), code
+
+
 @bp_buyer.route("/mark_order_received", methods=["POST"])
 def mark_order_received():
     user_id = request.json.get("user_id")
@@ -62,13 +73,39 @@ def cancel_order():
     return jsonify({"message": message}), code
 
 
+@bp_buyer.route("/cancel_orders", methods=["POST"])
+def cancel_orders():
+    user_id = request.json.get("user_id")
+    password = request.json.get("password")
+    order_ids = request.json.get("order_ids")
+    b = BuyerAPI()
+    code, message, results = b.cancel_orders(user_id, password, order_ids)
+    return jsonify({"message": message, "results": results}), code
+
+
 @bp_buyer.route("/query_all_orders", methods=["POST"])
 def query_all_orders():
     user_id = request.json.get("user_id")
     password = request.json.get("password")
+    stream = request.json.get("stream")
+    if stream is not None and stream not in STREAM_FORMATS:
+        code, message = error_invalid_query_order_behaviour()
+        return json_response({"message": message, "orders": []}, code)
+
     b = BuyerAPI()
-    code, message, orders = b.query_all_orders(user_id, password)
-    return jsonify({"message": message, "orders": orders}), code
+    code, message, orders = b.query_all_orders(
+        user_id,
+        password,
+        limit=request.json.get("limit"),
+        before_timestamp=request.json.get("before_timestamp"),
+        status=request.json.get("status"),
+        with_details=request.json.get("with_details", False),
+        with_titles=request.json.get("with_titles", False),
+        stream=stream is not None,
+    )
+    if stream is not None and code == 200:
+        return stream_response(stream, {"message": message}, "orders", orders, code)
+    return json_response({"message": message, "orders": orders}, code)
 
 
 @bp_buyer.route("/query_one_order", methods=["POST"])
@@ -76,6 +113,18 @@ def query_one_order():
     user_id = request.json.get("user_id")
     password = request.json.get("password")
     order_id = request.json.get("order_id")
+    with_titles = request.json.get("with_titles", False)
+    b = BuyerAPI()
+    code, message, order = b.query_one_order(user_id, password, order_id, with_titles)
+    return json_response({"message": message, "order": order}, code)
+
+
+@bp_buyer.route("/query_orders", methods=["POST"])
+def query_orders():
+    user_id = request.json.get("user_id")
+    password = request.json.get("password")
+    order_ids = request.json.get("order_ids")
+    with_titles = request.json.get("with_titles", False)
     b = BuyerAPI()
-    code, message, order = b.query_one_order(user_id, password, order_id)
-    return jsonify({"message": message, "order": order}), code
+    code, message, orders = b.query_orders(user_id, password, order_ids, with_titles)
+    return json_response({"message": message, "orders": orders}, code)
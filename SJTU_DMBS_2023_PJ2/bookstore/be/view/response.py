@@ -0,0 +1,94 @@
+"""JSON responses of the views.
+
+The responses are encoded by orjson when it is installed, which is several
+times faster than the standard library on the large lists of books and orders.
+Without it, they fall back to the json module, with the same output.
+
+Large result sets can be streamed instead, as a JSON object whose list is
+written chunk by chunk, or as NDJSON with one item per line.
+"""
+
+import json
+
+from flask import Response, stream_with_context
+from be import conf
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    """Encode data as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(data, code: int = 200) -> Response:
+    """A JSON response of data, replacing jsonify on the hot endpoints."""
+    return Response(dumps(data), status=code, mimetype="application/json")
+
+
+# values of the "stream" key of a request
+STREAM_FORMATS = ("json", "ndjson")
+
+
+def _encoded_batches(items, batch_size: int):
+    """Encode the items, yielding them in lists of at most batch_size."""
+    batch = []
+    for item in items:
+        batch.append(dumps(item))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_response(
+    stream_format: str,
+    head: dict,
+    key: str,
+    items,
+    code: int = 200,
+    batch_size: int = conf.STREAM_BATCH_SIZE,
+) -> Response:
+    """A chunked response of the items, encoded while they are iterated.
+
+    Parameters
+    ----------
+    stream_format : str
+        "json" for the object `head` with the items as a list under `key`, the
+        same document as a `json_response`. "ndjson" for one item per line,
+        `head` and `key` are left out.
+
+    items : iterable
+        The items, usually a lazy iterator fetching them from the database. It
+        is consumed in the context of the request.
+    """
+    if stream_format == "ndjson":
+
+        def generate():
+            for batch in _encoded_batches(items, batch_size):
+                yield b"\n".join(batch) + b"\n"
+
+        mimetype = "application/x-ndjson"
+    else:
+
+        def generate():
+            # the head without its closing brace, then the list
+            prefix = dumps(head)[:-1]
+            if head:
+                prefix += b","
+            yield prefix + dumps(key) + b":["
+            separator = b""
+            for batch in _encoded_batches(items, batch_size):
+                yield separator + b",".join(batch)
+                separator = b","
+            yield b"]}"
+
+        mimetype = "application/json"
+
+    return Response(stream_with_context(generate()), status=code, mimetype=mimetype)
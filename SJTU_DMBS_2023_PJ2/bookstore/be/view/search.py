@@ -1,12 +1,33 @@
 from flask import Blueprint
 from flask import request
-from flask import jsonify
+from be.view.response import json_response, stream_response, STREAM_FORMATS
 from be.model.search import SearchAPI
+from be.model.error import error_invalid_query_book_behaviour
 
 bp_search = Blueprint("search", __name__, url_prefix="/search")
 
+
 @bp_search.route("/query_book", methods=["POST"])
 def query_book():
     restriction = request.json
-    code, message , result = SearchAPI().query_book(**restriction)
-    return jsonify({"message": message,"books":result}), code 
\ No newline at end of file
+    with_total = restriction.pop("with_total", False)
+    stream = restriction.pop("stream", None)
+    if stream is not None and stream not in STREAM_FORMATS:
+        code, message = error_invalid_query_book_behaviour()
+        return json_response({"message": message, "books": []}, code)
+
+    code, message, result = SearchAPI().query_book(
+        stream=stream is not None, **restriction
+    )
+    response = {"message": message, "books": result}
+    if with_total and code == 200:
+        code, response["message"], response["total"] = SearchAPI().count_book(
+            **restriction
+        )
+    if stream is not None:
+        books = response.pop("books")
+        if code == 200:
+            return stream_response(stream, response, "books", books, code)
+        # the lazy books are never fetched after an error
+        response["books"] = []
+    return json_response(response, code)
@@ -1,6 +1,7 @@
 from flask import Blueprint
 from flask import request
 from flask import jsonify
+from be.view.response import json_response
 from be.model import seller
 import json
 
@@ -31,6 +32,36 @@ def seller_add_book():
     return jsonify({"message": message}), code
 
 
+def _ndjson_items(stream):
+    """Parse the lines of an NDJSON upload lazily, None for a malformed line."""
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+@bp_seller.route("/add_books", methods=["POST"])
+def seller_add_books():
+    # a JSON document with the list of books, or an NDJSON upload with one book
+    # per line and the ids in the query string
+    if request.mimetype == "application/x-ndjson":
+        user_id: str = request.args.get("user_id")
+        store_id: str = request.args.get("store_id")
+        books = _ndjson_items(request.stream)
+    else:
+        user_id: str = request.json.get("user_id")
+        store_id: str = request.json.get("store_id")
+        books: list = request.json.get("books", [])
+
+    s = seller.SellerAPI()
+    code, message, results = s.add_books(user_id, store_id, books)
+
+    return json_response({"message": message, "results": results}, code)
+
+
 @bp_seller.route("/add_stock_level", methods=["POST"])
 def add_stock_level():
     user_id: str = request.json.get("user_id")
@@ -44,6 +75,19 @@ def add_stock_level():
     return jsonify({"message": message}), code
 
 
+@bp_seller.route("/set_stock_shards", methods=["POST"])
+def set_stock_shards():
+    user_id: str = request.json.get("user_id")
+    store_id: str = request.json.get("store_id")
+    book_id: str = request.json.get("book_id")
+    shards: int = request.json.get("shards", 0)
+
+    s = seller.SellerAPI()
+    code, message = s.set_stock_shards(user_id, store_id, book_id, shards)
+
+    return jsonify({"message": message}), code
+
+
 @bp_seller.route("/mark_order_shipped", methods=["POST"])
 def mark_order_shipped():
     store_id: str = request.json.get("store_id")
@@ -53,3 +97,24 @@ def mark_order_shipped():
     code, message = s.mark_order_shipped(store_id, order_id)
 
     return jsonify({"message": message}), code
+
+
+@bp_seller.route("/query_store_orders", methods=["POST"])
+def query_store_orders():
+    user_id: str = request.json.get("user_id")
+    password: str = request.json.get("password")
+    store_id: str = request.json.get("store_id")
+
+    s = seller.SellerAPI()
+    code, message, orders = s.query_store_orders(
+        user_id,
+        password,
+        store_id,
+        limit=request.json.get("limit"),
+        before_timestamp=request.json.get("before_timestamp"),
+        status=request.json.get("status"),
+        with_details=request.json.get("with_details", False),
+        with_titles=request.json.get("with_titles", False),
+    )
+
+    return json_response({"message": message, "orders": orders}, code)
@@ -0,0 +1,33 @@
+from flask import Blueprint
+from flask import jsonify
+from be.model.base import get_pool_stats, get_index_report
+from be.model.sweeper import get_sweeper_stats
+from be.model.settler import get_settler_stats
+from be.model.auth_cache import get_auth_cache_stats
+
+bp_stats = Blueprint("stats", __name__, url_prefix="/stats")
+
+
+@bp_stats.route("/pool", methods=["GET"])
+def pool_stats():
+    return jsonify({"message": "ok", "pool": get_pool_stats()}), 200
+
+
+@bp_stats.route("/indexes", methods=["GET"])
+def index_report():
+    return jsonify({"message": "ok", "indexes": get_index_report()}), 200
+
+
+@bp_stats.route("/sweeper", methods=["GET"])
+def sweeper_stats():
+    return jsonify({"message": "ok", "sweeper": get_sweeper_stats()}), 200
+
+
+@bp_stats.route("/settler", methods=["GET"])
+def settler_stats():
+    return jsonify({"message": "ok", "settler": get_settler_stats()}), 200
+
+
+@bp_stats.route("/auth_cache", methods=["GET"])
+def auth_cache_stats():
+    return jsonify({"message": "ok", "auth_cache": get_auth_cache_stats()}), 200
@@ -48,6 +48,14 @@ class Buyer:
         r = requests.post(url, headers=headers, json=json)
         return r.status_code
 
+    def query_balance(self) -> (int, int):
+        json = {"user_id": self.user_id, "password": self.password}
+        url = urljoin(self.url_prefix, "query_balance")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json)
+        response_json = r.json()
+        return r.status_code, response_json.get("balance")
+
     def mark_order_received(self, order_id: str) -> int:
         json = {
             "user_id": self.user_id,
@@ -70,22 +78,61 @@ class Buyer:
         r = requests.post(url, headers=headers, json=json)
         return r.status_code
 
-    def query_all_orders(self) -> (int, list):
+    def cancel_orders(self, order_ids: [str]) -> (int, list):
+        json = {
+            "user_id": self.user_id,
+            "password": self.password,
+            "order_ids": order_ids,
+        }
+        url = urljoin(self.url_prefix, "cancel_orders")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json)
+        response_json = r.json()
+        return r.status_code, response_json.get("results")
+
+    def query_all_orders(self, **kwargs) -> (int, list):
         json = {"user_id": self.user_id, "password": self.password}
+        json.update(kwargs)
         url = urljoin(self.url_prefix, "query_all_orders")
         headers = {"token": self.token}
         r = requests.post(url, headers=headers, json=json)
         response_json = r.json()
         return r.status_code, response_json.get("orders")
 
-    def query_one_order(self, order_id: str) -> (int, dict):
+    def query_all_orders_ndjson(self, **kwargs) -> (int, list):
+        json = {"user_id": self.user_id, "password": self.password, "stream": "ndjson"}
+        json.update(kwargs)
+        url = urljoin(self.url_prefix, "query_all_orders")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json, stream=True)
+        if r.status_code != 200:
+            return r.status_code, r.json().get("orders")
+        return r.status_code, [
+            simplejson.loads(line) for line in r.iter_lines() if line
+        ]
+
+    def query_one_order(self, order_id: str, with_titles: bool = False) -> (int, dict):
         json = {
             "user_id": self.user_id,
             "password": self.password,
             "order_id": order_id,
+            "with_titles": with_titles,
         }
         url = urljoin(self.url_prefix, "query_one_order")
         headers = {"token": self.token}
         r = requests.post(url, headers=headers, json=json)
         response_json = r.json()
         return r.status_code, response_json.get("order")
+
+    def query_orders(self, order_ids: [str], with_titles: bool = False) -> (int, list):
+        json = {
+            "user_id": self.user_id,
+            "password": self.password,
+            "order_ids": order_ids,
+            "with_titles": with_titles,
+        }
+        url = urljoin(self.url_prefix, "query_orders")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json)
+        response_json = r.json()
+        return r.status_code, response_json.get("orders")
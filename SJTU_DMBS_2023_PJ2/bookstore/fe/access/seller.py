@@ -1,4 +1,5 @@
 import requests
+import simplejson
 from urllib.parse import urljoin
 from fe.access import book
 from fe.access.auth import Auth
@@ -39,6 +40,40 @@ class Seller:
         print("ms",r.json().get("message"))
         return r.status_code
 
+    def add_books(
+        self, store_id: str, stock_level: int, books: [book.Book]
+    ) -> (int, list):
+        json = {
+            "user_id": self.seller_id,
+            "store_id": store_id,
+            "books": [
+                {"book_info": b.__dict__, "stock_level": stock_level} for b in books
+            ],
+        }
+        url = urljoin(self.url_prefix, "add_books")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json)
+        return r.status_code, r.json().get("results")
+
+    def add_books_ndjson(
+        self, store_id: str, stock_level: int, books: [book.Book]
+    ) -> (int, list):
+        lines = (
+            simplejson.dumps({"book_info": b.__dict__, "stock_level": stock_level})
+            + "\n"
+            for b in books
+        )
+        url = urljoin(self.url_prefix, "add_books")
+        headers = {"token": self.token, "Content-Type": "application/x-ndjson"}
+        params = {"user_id": self.seller_id, "store_id": store_id}
+        r = requests.post(
+            url,
+            headers=headers,
+            params=params,
+            data="".join(lines).encode("utf-8"),
+        )
+        return r.status_code, r.json().get("results")
+
     def add_stock_level(
         self, seller_id: str, store_id: str, book_id: str, add_stock_num: int
     ) -> int:
@@ -54,6 +89,18 @@ class Seller:
         r = requests.post(url, headers=headers, json=json)
         return r.status_code
 
+    def set_stock_shards(self, store_id: str, book_id: str, shards: int) -> int:
+        json = {
+            "user_id": self.seller_id,
+            "store_id": store_id,
+            "book_id": book_id,
+            "shards": shards,
+        }
+        url = urljoin(self.url_prefix, "set_stock_shards")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json)
+        return r.status_code
+
     def mark_order_shipped(self, store_id: str, order_id: str) -> int:
         json = {"store_id": store_id, "order_id": order_id}
         # print(simplejson.dumps(json))
@@ -61,3 +108,15 @@ class Seller:
         headers = {"token": self.token}
         r = requests.post(url, headers=headers, json=json)
         return r.status_code
+
+    def query_store_orders(self, store_id: str, **kwargs) -> (int, list):
+        json = {
+            "user_id": self.seller_id,
+            "password": self.password,
+            "store_id": store_id,
+        }
+        json.update(kwargs)
+        url = urljoin(self.url_prefix, "query_store_orders")
+        headers = {"token": self.token}
+        r = requests.post(url, headers=headers, json=json)
+        return r.status_code, r.json().get("orders")
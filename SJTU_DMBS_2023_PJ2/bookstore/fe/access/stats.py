@@ -0,0 +1,32 @@
+import requests
+from urllib.parse import urljoin
+
+
+class Stats:
+    def __init__(self, url_prefix):
+        self.url_prefix = urljoin(url_prefix, "stats/")
+
+    def pool(self) -> (int, dict):
+        url = urljoin(self.url_prefix, "pool")
+        r = requests.get(url)
+        return r.status_code, r.json().get("pool")
+
+    def indexes(self) -> (int, dict):
+        url = urljoin(self.url_prefix, "indexes")
+        r = requests.get(url)
+        return r.status_code, r.json().get("indexes")
+
+    def sweeper(self) -> (int, dict):
+        url = urljoin(self.url_prefix, "sweeper")
+        r = requests.get(url)
+        return r.status_code, r.json().get("sweeper")
+
+    def auth_cache(self) -> (int, dict):
+        url = urljoin(self.url_prefix, "auth_cache")
+        r = requests.get(url)
+        return r.status_code, r.json().get("auth_cache")
+
+    def settler(self) -> (int, dict):
+        url = urljoin(self.url_prefix, "settler")
+        r = requests.get(url)
+        return r.status_code, r.json().get("settler")
@@ -0,0 +1,45 @@
+from fe.access.auth import Auth
+from fe import conf
+import threading
+import time
+import uuid
+
+
+class LoginBench:
+    """Login throughput with concurrent clients, each logging in its own users."""
+
+    def __init__(self, thread_num: int, user_num: int):
+        self.thread_num = thread_num
+        self.users = []
+        auth = Auth(conf.URL)
+        for i in range(user_num):
+            user_id = "login_bench_user_{}_{}".format(i, str(uuid.uuid1()))
+            password = "password_" + user_id
+            assert auth.register(user_id, password) == 200
+            self.users.append((user_id, password))
+        self.time_login = 0
+        self.throughput = 0
+
+    def run_login_bench(self, login_num: int):
+        per_thread = max(login_num // self.thread_num, 1)
+        errors = []
+
+        def login(no: int):
+            auth = Auth(conf.URL)
+            for i in range(per_thread):
+                user_id, password = self.users[(no + i) % len(self.users)]
+                code, token = auth.login(user_id, password, "terminal_bench")
+                if code != 200:
+                    errors.append(code)
+
+        threads = [
+            threading.Thread(target=login, args=(i,)) for i in range(self.thread_num)
+        ]
+        before = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.time_login = time.time() - before
+        self.throughput = per_thread * self.thread_num / self.time_login
+        assert not errors
@@ -2,6 +2,7 @@ from fe.bench.workload import Workload
 from fe.bench.session import Session
 from fe.bench.query_order_bench import QueryOrderBench
 from fe.bench.query_book_bench import QueryBookBench
+from fe.bench.login_bench import LoginBench
 from fe import conf
 
 
@@ -54,6 +55,17 @@ def run_query_book_bench(show_stat=False):
         print(f"Bench Result: time_query_book={bench.time_query_book:.4}")
 
 
+def run_login_bench(show_stat=False):
+    bench = LoginBench(conf.Bench_Login_Threads, conf.Bench_Login_Users)
+    bench.run_login_bench(conf.Bench_Login_Num)
+
+    if show_stat:
+        print(
+            f"Bench Result: time_login={bench.time_login:.4}, "
+            f"login_per_second={bench.throughput:.4}"
+        )
+
+
 if __name__ == "__main__":
     # run_bench(show_stat=True)
     # run_query_order_bench(show_stat=True)
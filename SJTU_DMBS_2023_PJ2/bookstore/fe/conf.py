@@ -14,8 +14,16 @@ Use_Large_DB = False
 # Request_Per_Session = 1
 # Bench_Order_Queries_Num = 5
 # Bench_Book_Queries_Num = 1
+# Bench_Login_Num = 16
 
 # Normal Bench
 Request_Per_Session = 1000
 Bench_Order_Queries_Num = 500
 Bench_Book_Queries_Num = 1000
+Bench_Login_Num = 400
+
+# Login Bench
+Bench_Login_Threads = 8
+Bench_Login_Users = 40
+# scrypt cost of the backend started by the tests, the production one is 2**14
+Test_Scrypt_N = 2**10
@@ -1,9 +1,16 @@
+import os
 import requests
 import threading
 from urllib.parse import urljoin
-from be import serve
 from fe import conf
 
+# The backend under test hashes passwords at a low scrypt cost, so that the
+# logins of the tests and of test_login_bench do not take minutes. It has to be
+# set before be reads its config, and is inherited by the hashing processes.
+os.environ.setdefault("BOOKSTORE_SCRYPT_N", str(conf.Test_Scrypt_N))
+
+from be import serve  # noqa: E402
+
 thread: threading.Thread = None
 
 
@@ -49,3 +49,13 @@ class TestAddBook:
             code = self.seller.add_book(self.store_id, 0, b)
             assert code != 200
 
+
+    def test_same_book_in_two_stores(self):
+        other_store_id = self.store_id + "_other"
+        code = self.seller.create_store(other_store_id)
+        assert code == 200
+        for b in self.books:
+            code = self.seller.add_book(self.store_id, 0, b)
+            assert code == 200
+            code = self.seller.add_book(other_store_id, 0, b)
+            assert code == 200
@@ -0,0 +1,87 @@
+import pytest
+
+from fe.access.new_seller import register_new_seller
+from fe.access.search import Search
+from fe.access import book
+from fe import conf
+import copy
+import uuid
+
+
+class TestAddBooks:
+    @pytest.fixture(autouse=True)
+    def pre_run_initialization(self):
+        # do before test
+        self.seller_id = "test_add_books_seller_id_{}".format(str(uuid.uuid1()))
+        self.store_id = "test_add_books_store_id_{}".format(str(uuid.uuid1()))
+        self.password = self.seller_id
+        self.seller = register_new_seller(self.seller_id, self.password)
+
+        code = self.seller.create_store(self.store_id)
+        assert code == 200
+        book_db = book.BookDB()
+        self.books = book_db.get_book_info(0, 5)
+        self.search = Search(conf.URL)
+
+        yield
+        # do after test
+
+    def test_ok(self):
+        code, results = self.seller.add_books(self.store_id, 10, self.books)
+        assert code == 200
+        assert [r["book_id"] for r in results] == [b.id for b in self.books]
+        assert all(r["code"] == 200 for r in results)
+
+        code, result = self.search.query_book(store_id=self.store_id)
+        assert code == 200
+        assert sorted(r["id"] for r in result) == sorted(b.id for b in self.books)
+        assert all(r["stock_level"] == 10 for r in result)
+
+    def test_ndjson_ok(self):
+        code, results = self.seller.add_books_ndjson(self.store_id, 10, self.books)
+        assert code == 200
+        assert [r["book_id"] for r in results] == [b.id for b in self.books]
+        assert all(r["code"] == 200 for r in results)
+
+    def test_exist_book_id(self):
+        code = self.seller.add_book(self.store_id, 0, self.books[0])
+        assert code == 200
+
+        # the first book exists, and the last one is repeated
+        books = self.books + [self.books[-1]]
+        code, results = self.seller.add_books(self.store_id, 0, books)
+        assert code == 200
+        assert [r["code"] for r in results] == [516] + [200] * (len(books) - 2) + [516]
+
+    def test_invalid_book(self):
+        bad = book.Book()
+        bad.id = None
+        code, results = self.seller.add_books(self.store_id, 0, [bad] + self.books)
+        assert code == 200
+        assert results[0]["code"] != 200
+        assert all(r["code"] == 200 for r in results[1:])
+
+    def test_missing_book_info(self):
+        bad = copy.copy(self.books[2])
+        bad.id = bad.id + "_no_title"
+        del bad.title
+        books = self.books[:2] + [bad] + self.books[2:]
+        code, results = self.seller.add_books(self.store_id, 0, books)
+        assert code == 200
+        codes = [r["code"] for r in results]
+        assert codes[2] == 530
+        assert codes[:2] + codes[3:] == [200] * len(self.books)
+
+        code, result = self.search.query_book(store_id=self.store_id)
+        assert code == 200
+        assert sorted(r["id"] for r in result) == sorted(b.id for b in self.books)
+
+    def test_error_non_exist_store_id(self):
+        code, results = self.seller.add_books(self.store_id + "x", 0, self.books)
+        assert code == 513
+        assert results == []
+
+    def test_error_non_exist_user_id(self):
+        self.seller.seller_id = self.seller.seller_id + "_x"
+        code, results = self.seller.add_books(self.store_id, 0, self.books)
+        assert code == 511
@@ -18,6 +18,19 @@ class TestAddFunds:
         code = self.buyer.add_funds(-1000)
         assert code == 200
 
+    def test_query_balance_ok(self):
+        code = self.buyer.add_funds(1000)
+        assert code == 200
+
+        code, balance = self.buyer.query_balance()
+        assert code == 200
+        assert balance == 1000
+
+    def test_query_balance_error_password(self):
+        self.buyer.password = self.buyer.password + "_x"
+        code, balance = self.buyer.query_balance()
+        assert code == 401
+
     def test_error_user_id(self):
         self.buyer.user_id = self.buyer.user_id + "_x"
         code = self.buyer.add_funds(10)
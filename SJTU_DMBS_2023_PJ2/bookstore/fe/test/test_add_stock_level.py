@@ -44,3 +44,11 @@ class TestAddStockLevel:
             book_id = b.id
             code = self.seller.add_stock_level(self.user_id, self.store_id, book_id, 10)
             assert code == 200
+
+    def test_book_not_in_store(self):
+        other_store_id = self.store_id + "_other"
+        code = self.seller.create_store(other_store_id)
+        assert code == 200
+        for b in self.books:
+            code = self.seller.add_stock_level(self.user_id, other_store_id, b.id, 10)
+            assert code != 200
@@ -0,0 +1,73 @@
+from be.model.auth_cache import AuthCache
+from be.model.base import session_scope, User
+from be.model.password import hash_password
+from fe.access.auth import Auth
+from fe.access.new_buyer import register_new_buyer
+from fe import conf
+import time
+import uuid
+
+
+class TestAuthCache:
+    def test_ok(self):
+        cache = AuthCache(capacity=2, ttl=60)
+        cache.put_password("user", "password", "hash")
+        cache.put_token("user", "token", 1.0)
+        assert cache.check_password("user", "password", "hash")
+        assert not cache.check_password("user", "password_x", "hash")
+        assert cache.check_token("user", "token") == 1.0
+        assert cache.check_token("user", "token_x") is None
+
+        cache.invalidate("user")
+        assert not cache.check_password("user", "password", "hash")
+
+    def test_stored_hash_changed(self):
+        cache = AuthCache(capacity=2, ttl=60)
+        cache.put_password("user", "password", "hash")
+        # the password is changed, or the user registered again
+        assert not cache.check_password("user", "password", "hash_x")
+
+    def test_capacity(self):
+        cache = AuthCache(capacity=2, ttl=60)
+        for user_id in ("user1", "user2", "user3"):
+            cache.put_password(user_id, "password", "hash")
+        assert not cache.check_password("user1", "password", "hash")
+        assert cache.check_password("user3", "password", "hash")
+
+    def test_password_does_not_renew_token(self):
+        cache = AuthCache(capacity=2, ttl=1)
+        cache.put_token("user", "token", 1.0)
+        time.sleep(0.6)
+        # e.g. a login after the cache missed the password
+        cache.put_password("user", "password", "hash")
+        time.sleep(0.6)
+        # the token may be logged out by another worker meanwhile
+        assert cache.check_token("user", "token") is None
+        assert cache.check_password("user", "password", "hash")
+
+
+class TestAuthCacheRevocation:
+    """Changes made by another worker process, which does not clear this cache."""
+
+    def update_user(self, user_id: str, **values):
+        with session_scope() as session:
+            session.query(User).filter(User.id == user_id).update(values)
+            session.commit()
+
+    def test_password_changed(self):
+        user_id = "test_auth_cache_user_id_{}".format(str(uuid.uuid1()))
+        buyer = register_new_buyer(user_id, user_id)
+        assert buyer.add_funds(1) == 200
+
+        self.update_user(user_id, password=hash_password(user_id + "_x"))
+        assert buyer.add_funds(1) == 401
+
+    def test_logged_out(self):
+        user_id = "test_auth_cache_user_id_{}".format(str(uuid.uuid1()))
+        register_new_buyer(user_id, user_id)
+        auth = Auth(conf.URL)
+        code, token = auth.login(user_id, user_id, "terminal")
+        assert code == 200
+
+        self.update_user(user_id, token="logged_out")
+        assert auth.logout(user_id, token) == 401
@@ -1,4 +1,9 @@
-from fe.bench.run import run_bench, run_query_order_bench, run_query_book_bench
+from fe.bench.run import (
+    run_bench,
+    run_query_order_bench,
+    run_query_book_bench,
+    run_login_bench,
+)
 
 
 def test_bench():
@@ -20,3 +25,10 @@ def test_query_books_bench():
         run_query_book_bench()
     except Exception as e:
         assert 200 == 100, "test_query_books_bench 过程出现异常"
+
+
+def test_login_bench():
+    try:
+        run_login_bench()
+    except Exception as e:
+        assert 200 == 100, "test_login_bench 过程出现异常"
@@ -0,0 +1,136 @@
+import pytest
+
+from be import conf
+from be import import_books
+from be.model.base import BookInfo
+from sqlalchemy import create_engine, delete, func, select, text
+import csv
+import io
+import json
+import sqlite3
+import uuid
+
+SQLITE_SCHEMA = (
+    "CREATE TABLE book (id TEXT PRIMARY KEY, title TEXT, author TEXT, "
+    "publisher TEXT, original_title TEXT, translator TEXT, pub_year TEXT, "
+    "pages INTEGER, price INTEGER, currency_unit TEXT, binding TEXT, isbn TEXT, "
+    "author_intro TEXT, book_intro TEXT, content TEXT, tags TEXT, picture BLOB)"
+)
+
+
+class TestImportBooks:
+    @pytest.fixture(autouse=True)
+    def pre_run_initialization(self, tmp_path):
+        self.prefix = "test_import_books_{}_".format(str(uuid.uuid1()))
+        self.db_path = str(tmp_path / "book.db")
+        self.records = []
+        for i in range(10):
+            self.records.append(
+                {
+                    "id": "{}{:02}".format(self.prefix, i),
+                    # separators, quotes and line breaks must survive the CSV
+                    "title": '标题 {}, "quoted" \\ back'.format(i),
+                    "author": "作者",
+                    "publisher": "",
+                    "original_title": None,
+                    "translator": "a\nb",
+                    "pub_year": "2023-1",
+                    "pages": None if i == 0 else 100 + i,
+                    "price": 1000 + i,
+                    "currency_unit": "元",
+                    "binding": "平装",
+                    "isbn": "978{}".format(i),
+                    "author_intro": "intro,\r\nline",
+                    "book_intro": "",
+                    "content": "content",
+                    "tags": "tag1\n\ntag2\n",
+                    "picture": b"\x00\x01\xff" if i % 2 else None,
+                }
+            )
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(SQLITE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO book VALUES ({})".format(", ".join("?" * 17)),
+            [
+                tuple(record[column] for column in import_books.SQLITE_COLUMNS)
+                for record in self.records
+            ],
+        )
+        conn.commit()
+        conn.close()
+
+        self.engine = create_engine(conf.DB_URL)
+        yield
+        with self.engine.begin() as conn:
+            conn.execute(delete(BookInfo).where(BookInfo.id.like(self.prefix + "%")))
+        self.engine.dispose()
+
+    def test_book_row(self):
+        names = [column.name for column in import_books.COLUMNS]
+        values = dict(zip(names, import_books.book_row(self.records[1])))
+        assert values["title"] == self.records[1]["title"]
+        assert values["pages"] == 101
+        assert values["tags"] == json.dumps(["tag1", "tag2"])
+        assert values["pictures"] == json.dumps(["AAH/"])
+        # None is stored as JSON, a missing integer as 0
+        assert values["original_title"] == "null"
+        values = dict(zip(names, import_books.book_row(self.records[0])))
+        assert values["pages"] == 0 and values["pictures"] == "[]"
+
+    def test_csv_stream(self):
+        rows = [import_books.book_row(record) for record in self.records] + [
+            ["", 'a "b", c', "line\nbreak", 0]
+        ]
+        data = import_books.CsvStream(rows).read()
+        # read in small chunks, as COPY does
+        stream = import_books.CsvStream(rows)
+        chunks = iter(lambda: stream.read(7), "")
+        assert "".join(chunks) == data
+        assert stream.count == len(rows)
+
+        parsed = list(csv.reader(io.StringIO(data), quoting=csv.QUOTE_NONNUMERIC))
+        assert [
+            [int(v) if isinstance(v, float) else v for v in row] for row in parsed
+        ] == rows
+
+    def test_split_ids(self):
+        ids = sorted(record["id"] for record in self.records)
+        assert import_books.split_ids(self.db_path, 1) == [(None, None)]
+        assert import_books.split_ids(self.db_path, 2) == [
+            (None, ids[5]),
+            (ids[5], None),
+        ]
+        # more parts than books
+        ranges = import_books.split_ids(self.db_path, 20)
+        assert ranges[0][0] is None and ranges[-1][1] is None
+        loaded = [
+            row[0]
+            for low, high in ranges
+            for row in import_books.read_books(self.db_path, low, high)
+        ]
+        assert loaded == ids
+
+    def test_import(self):
+        total = import_books.import_books(self.db_path, conf.DB_URL, workers=2)
+        assert total == len(self.records)
+
+        with self.engine.connect() as conn:
+            count = conn.execute(
+                select(func.count())
+                .select_from(BookInfo)
+                .where(BookInfo.id.like(self.prefix + "%"))
+            ).scalar()
+            assert count == len(self.records)
+            title = conn.execute(
+                select(BookInfo.title).where(BookInfo.id == self.records[3]["id"])
+            ).scalar()
+            assert title == self.records[3]["title"]
+
+            # the indexes dropped for the load are built again
+            indexes = set(
+                conn.execute(
+                    text("SELECT indexname FROM pg_indexes WHERE tablename = :table"),
+                    {"table": BookInfo.__tablename__},
+                ).scalars()
+            )
+        assert {index.name for index in BookInfo.__table__.indexes} <= indexes
@@ -37,3 +37,14 @@ class TestLogin:
     def test_error_password(self):
         code, token = self.auth.login(self.user_id, self.password + "_x", self.terminal)
         assert code == 401
+
+    def test_logout_twice(self):
+        code, token = self.auth.login(self.user_id, self.password, self.terminal)
+        assert code == 200
+
+        code = self.auth.logout(self.user_id, token)
+        assert code == 200
+
+        # the token is not valid any more, even if it was cached
+        code = self.auth.logout(self.user_id, token)
+        assert code == 401
@@ -40,6 +40,16 @@ class TestNewOrder:
         code, _ = self.buyer.new_order(self.store_id, buy_book_id_list)
         assert code == 200
 
+    def test_repeated_book_id(self):
+        ok, buy_book_id_list = self.gen_book.gen(
+            non_exist_book_id=False, low_stock_level=False
+        )
+        assert ok
+        # the same book in two lines is reserved as one line of count 2
+        book_id, _ = buy_book_id_list[0]
+        code, _ = self.buyer.new_order(self.store_id, [(book_id, 1), (book_id, 1)])
+        assert code == 200
+
     def test_non_exist_user_id(self):
         ok, buy_book_id_list = self.gen_book.gen(
             non_exist_book_id=False, low_stock_level=False
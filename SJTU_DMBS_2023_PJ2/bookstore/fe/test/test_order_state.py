@@ -4,8 +4,11 @@ from fe.access.buyer import Buyer
 from fe.test.gen_book_data import GenBook
 from fe.access.new_buyer import register_new_buyer
 from fe.access.book import Book
+from be.model.base import session_scope, Order
+from be.model.sweeper import OrderSweeper
+from be.model.utils import ORDER_EXPIRED_TIME_INTERVAL
+from sqlalchemy import update
 import uuid
-import time
 
 
 class TestOrderState:
@@ -67,13 +70,35 @@ class TestOrderState:
         code = self.buyer.payment(self.order_id)
         assert code != 200
 
+    def expire_order(self):
+        # backdate the order, instead of waiting for it to expire
+        with session_scope() as session:
+            session.execute(
+                update(Order)
+                .where(Order.id == self.order_id)
+                .values(timestamp=Order.timestamp - ORDER_EXPIRED_TIME_INTERVAL - 1)
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+
     def test_expired(self):
         code = self.buyer.add_funds(self.total_price)
         assert code == 200
-
-        # code = self.buyer.cancel_order(self.order_id)
-        # assert code == 200
-        time.sleep(13)
+        self.expire_order()
 
         code = self.buyer.payment(self.order_id)
         assert code != 200
+        code, order = self.buyer.query_one_order(self.order_id)
+        assert code == 200
+        assert order["status"] == "canceled"
+
+    def test_expired_swept(self):
+        self.expire_order()
+
+        # the sweeper cancels the order without anyone trying to pay for it, a
+        # sweeper of the backend may have done it already
+        OrderSweeper(interval=1, batch_size=100).run_all()
+
+        code, order = self.buyer.query_one_order(self.order_id)
+        assert code == 200
+        assert order["status"] == "canceled"
@@ -45,3 +45,16 @@ class TestPassword:
 
         code, new_token = self.auth.login(self.user_id, self.new_password, self.terminal)
         assert code != 200
+
+    def test_old_password_after_change(self):
+        # the old password is verified, and may be cached, before the change
+        code, token = self.auth.login(self.user_id, self.old_password, self.terminal)
+        assert code == 200
+        code, token = self.auth.login(self.user_id, self.old_password, self.terminal)
+        assert code == 200
+
+        code = self.auth.password(self.user_id, self.old_password, self.new_password)
+        assert code == 200
+
+        code, token = self.auth.login(self.user_id, self.old_password, self.terminal)
+        assert code != 200
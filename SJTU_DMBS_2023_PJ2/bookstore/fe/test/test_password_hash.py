@@ -0,0 +1,24 @@
+from be.model import password
+from be import conf
+
+
+class TestPasswordHash:
+    def test_ok(self):
+        stored = password.hash_password("password")
+        assert password.is_hashed(stored)
+        assert password.check_password_hash("password", stored)
+        assert not password.check_password_hash("password_x", stored)
+
+    def test_parallel(self, monkeypatch):
+        # p is large enough for 256 * n * r bytes to be too little memory
+        monkeypatch.setattr(conf, "SCRYPT_N", 16)
+        monkeypatch.setattr(conf, "SCRYPT_P", 32)
+        stored = password.hash_password("password")
+        assert stored.split("$")[1:4] == ["16", str(conf.SCRYPT_R), "32"]
+        assert password.check_password_hash("password", stored)
+        assert not password.check_password_hash("password_x", stored)
+
+    def test_legacy_plaintext(self):
+        assert not password.is_hashed("password")
+        assert password.check_password_hash("password", "password")
+        assert not password.check_password_hash("password_x", "password")
@@ -6,6 +6,7 @@ from fe.test.gen_book_data import GenBook
 from fe.access.new_buyer import register_new_buyer
 from fe.access.book import Book
 from fe.access.auth import Auth
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 
 
@@ -117,6 +118,17 @@ class TestPayment:
         code = self.buyer.payment(self.order_id2)
         assert code != 200
 
+    def test_concurrent_payments(self):
+        # enough funds for either order, not for both
+        code = self.buyer.add_funds(max(self.total_price1, self.total_price2))
+        assert code == 200
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            codes = list(
+                executor.map(self.buyer.payment, [self.order_id1, self.order_id2])
+            )
+        assert codes.count(200) == 1
+
     def test_authorization_error(self):
         code = self.buyer.add_funds(self.total_price1)
         assert code == 200
@@ -29,6 +29,7 @@ class TestOrderState:
             non_exist_book_id=False, low_stock_level=False, max_book_count=5
         )
         self.buy_book_info_list = gen_book.buy_book_info_list
+        self.seller = gen_book.seller
         assert ok
         b = register_new_buyer(self.buyer_id, self.password)
         self.buyer = b
@@ -59,7 +60,8 @@ class TestOrderState:
 
         assert len(orders) == 2
 
-        order = orders[0]
+        # newest first
+        order = orders[1]
 
         assert order["id"] == self.order_id
 
@@ -77,6 +79,12 @@ class TestOrderState:
         code, order = self.buyer.query_one_order("xxx")
         assert code == 520
 
+    def test_one_order_another_buyer(self):
+        buyer_id = "test_order_state_buyer_id_{}".format(str(uuid.uuid1()))
+        b = register_new_buyer(buyer_id, self.password)
+        code, order = b.query_one_order(self.order_id)
+        assert code == 520
+
     def test_one_order_non_exist_user(self):
         self.buyer.user_id = "xxx"
         code, order = self.buyer.query_one_order(self.order_id)
@@ -86,3 +94,102 @@ class TestOrderState:
         self.buyer.user_id = "xxx"
         code, order = self.buyer.query_all_orders()
         assert code == 511
+
+    def test_all_orders_page_ok(self):
+        code, order_id2 = self.buyer.new_order(self.store_id, [])
+        assert code == 200
+        code, order_id3 = self.buyer.new_order(self.store_id, [])
+        assert code == 200
+
+        code, orders = self.buyer.query_all_orders(limit=2)
+        assert code == 200
+        assert [order["id"] for order in orders] == [order_id3, order_id2]
+
+        code, orders = self.buyer.query_all_orders(
+            limit=2, before_timestamp=orders[-1]["timestamp"]
+        )
+        assert code == 200
+        assert [order["id"] for order in orders] == [self.order_id]
+
+    def test_all_orders_status_ok(self):
+        code = self.buyer.cancel_order(self.order_id)
+        assert code == 200
+        code, order_id2 = self.buyer.new_order(self.store_id, [])
+        assert code == 200
+
+        code, orders = self.buyer.query_all_orders(status="canceled")
+        assert code == 200
+        assert [order["id"] for order in orders] == [self.order_id]
+
+    def test_all_orders_with_details_ok(self):
+        code, orders = self.buyer.query_all_orders(with_details=True)
+        assert code == 200
+        assert len(orders) == 1
+        details = orders[0]["details"]
+        assert len(details) == len(self.buy_book_info_list)
+        assert sum(d["count"] * d["price"] for d in details) == self.total_price
+
+    def test_all_orders_stream_ok(self):
+        code, self.order_id1 = self.buyer.new_order(self.store_id, [])
+        assert code == 200
+
+        code, orders = self.buyer.query_all_orders(stream="json", with_details=True)
+        assert code == 200
+        assert [order["id"] for order in orders] == [self.order_id1, self.order_id]
+        assert len(orders[1]["details"]) == len(self.buy_book_info_list)
+
+        code, orders = self.buyer.query_all_orders_ndjson(with_details=True)
+        assert code == 200
+        assert [order["id"] for order in orders] == [self.order_id1, self.order_id]
+        assert orders[0]["details"] == []
+
+    def test_all_orders_stream_error(self):
+        code, orders = self.buyer.query_all_orders(stream="xml")
+        assert code == 526
+        self.buyer.password += "_x"
+        code, orders = self.buyer.query_all_orders_ndjson()
+        assert code == 401
+
+    def test_all_orders_invalid_page(self):
+        code, orders = self.buyer.query_all_orders(limit=0)
+        assert code == 526
+        code, orders = self.buyer.query_all_orders(status="xxx")
+        assert code == 526
+
+    def test_store_orders_ok(self):
+        code, orders = self.seller.query_store_orders(self.store_id, with_details=True)
+        assert code == 200
+        assert [order["id"] for order in orders] == [self.order_id]
+        assert len(orders[0]["details"]) == len(self.buy_book_info_list)
+
+    def test_store_orders_authorization_error(self):
+        self.seller.password += "_x"
+        code, orders = self.seller.query_store_orders(self.store_id)
+        assert code == 401
+
+    def test_store_orders_non_exist_store(self):
+        code, orders = self.seller.query_store_orders(self.store_id + "_x")
+        assert code == 513
+
+    def test_one_order_details_ok(self):
+        code, order = self.buyer.query_one_order(self.order_id, with_titles=True)
+        assert code == 200
+        titles = {book.id: book.title for book, num in self.buy_book_info_list}
+        assert len(order["details"]) == len(titles)
+        for detail in order["details"]:
+            assert detail["title"] == titles[detail["book_id"]]
+
+    def test_orders_ok(self):
+        code, order_id2 = self.buyer.new_order(self.store_id, [])
+        assert code == 200
+
+        code, orders = self.buyer.query_orders([order_id2, "xxx", self.order_id])
+        assert code == 200
+        assert [order["id"] for order in orders] == [order_id2, self.order_id]
+        assert orders[0]["details"] == []
+        assert len(orders[1]["details"]) == len(self.buy_book_info_list)
+
+    def test_orders_authorization_error(self):
+        self.buyer.password += "_x"
+        code, orders = self.buyer.query_orders([self.order_id])
+        assert code == 401
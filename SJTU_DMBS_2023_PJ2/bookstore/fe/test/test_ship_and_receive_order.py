@@ -1,5 +1,6 @@
 import pytest
 
+from fe import conf
 from fe.access.buyer import Buyer
 from fe.test.gen_book_data import GenBook
 from fe.access.new_buyer import register_new_buyer
@@ -65,6 +66,27 @@ class TestShipAndReceiveOrder:
         code = self.buyer.mark_order_received(self.order_id)
         assert code == 200
 
+    def test_receive_credits_seller(self):
+        code = self.buyer.add_funds(self.total_price)
+        assert code == 200
+        code = self.buyer.payment(self.order_id)
+        assert code == 200
+        code = self.seller.mark_order_shipped(self.store_id, self.order_id)
+        assert code == 200
+
+        seller = Buyer(conf.URL, self.seller_id, self.password)
+        code, balance = seller.query_balance()
+        assert code == 200
+        assert balance == 0
+
+        code = self.buyer.mark_order_received(self.order_id)
+        assert code == 200
+
+        # counted before the settler folds the credit into the balance
+        code, balance = seller.query_balance()
+        assert code == 200
+        assert balance == self.total_price
+
     def test_ship_non_exist_order_id(self):
         code = self.seller.mark_order_shipped(self.store_id, "xxx")
         assert code == 520
@@ -0,0 +1,54 @@
+from fe.access.stats import Stats
+from fe.access.new_buyer import register_new_buyer
+from fe import conf
+import uuid
+
+
+class TestStats:
+    def test_pool_ok(self):
+        code, pool = Stats(conf.URL).pool()
+        assert code == 200
+        assert pool["checked_out"] >= 0
+        assert pool["overflow"] <= pool["max_overflow"]
+        if "leaks" in pool:
+            assert pool["leaks"]["checkouts"] >= pool["leaks"]["checkins"]
+
+    def test_pool_no_leak_on_errors(self):
+        buyer_id = "test_stats_buyer_id_{}".format(str(uuid.uuid1()))
+        buyer = register_new_buyer(buyer_id, buyer_id)
+        for _ in range(10):
+            code, _ = buyer.new_order(buyer_id + "_store", [])
+            assert code == 513
+            code = buyer.payment(buyer_id + "_order")
+            assert code == 520
+
+        # at most one connection for each background worker that is enabled
+        stats = Stats(conf.URL)
+        workers = 0
+        for get_stats in (stats.sweeper, stats.settler):
+            code, worker = get_stats()
+            assert code == 200
+            workers += worker["enabled"]
+
+        code, pool = stats.pool()
+        assert code == 200
+        assert pool["checked_out"] <= workers
+
+    def test_indexes_ok(self):
+        code, indexes = Stats(conf.URL).indexes()
+        assert code == 200
+        assert indexes["missing"] == []
+
+    def test_auth_cache_ok(self):
+        code, stats = Stats(conf.URL).auth_cache()
+        assert code == 200
+        if stats["enabled"]:
+            assert stats["size"] <= stats["capacity"]
+            assert stats["hits"] >= 0 and stats["misses"] >= 0
+
+    def test_settler_ok(self):
+        code, stats = Stats(conf.URL).settler()
+        assert code == 200
+        if stats["enabled"]:
+            assert stats["settled_entries"] >= 0
+            assert stats["interval"] > 0
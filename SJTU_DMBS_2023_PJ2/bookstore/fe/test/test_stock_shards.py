@@ -0,0 +1,89 @@
+import pytest
+
+from fe.access.new_seller import register_new_seller
+from fe.access.new_buyer import register_new_buyer
+from fe.access.search import Search
+from fe.access import book
+from fe import conf
+import uuid
+
+
+class TestStockShards:
+    @pytest.fixture(autouse=True)
+    def pre_run_initialization(self):
+        self.seller_id = "test_stock_shards_seller_id_{}".format(str(uuid.uuid1()))
+        self.store_id = "test_stock_shards_store_id_{}".format(str(uuid.uuid1()))
+        self.buyer_id = "test_stock_shards_buyer_id_{}".format(str(uuid.uuid1()))
+        self.password = self.seller_id
+        self.seller = register_new_seller(self.seller_id, self.password)
+        code = self.seller.create_store(self.store_id)
+        assert code == 200
+        self.book = book.BookDB().get_book_info(0, 1)[0]
+        code = self.seller.add_book(self.store_id, 10, self.book)
+        assert code == 200
+        self.buyer = register_new_buyer(self.buyer_id, self.password)
+        self.search = Search(conf.URL)
+        yield
+
+    def stock_level(self) -> int:
+        code, result = self.search.query_book(store_id=self.store_id, id=self.book.id)
+        assert code == 200
+        return result[0]["stock_level"]
+
+    def test_ok(self):
+        code = self.seller.set_stock_shards(self.store_id, self.book.id, 4)
+        assert code == 200
+        assert self.stock_level() == 10
+
+        code, order_id = self.buyer.new_order(self.store_id, [(self.book.id, 3)])
+        assert code == 200
+        assert self.stock_level() == 7
+
+        code = self.seller.add_stock_level(
+            self.seller_id, self.store_id, self.book.id, 5
+        )
+        assert code == 200
+        assert self.stock_level() == 12
+
+        code = self.buyer.cancel_order(order_id)
+        assert code == 200
+        assert self.stock_level() == 15
+
+    def test_order_from_several_shards(self):
+        code = self.seller.set_stock_shards(self.store_id, self.book.id, 4)
+        assert code == 200
+
+        # more than any shard holds
+        code, _ = self.buyer.new_order(self.store_id, [(self.book.id, 10)])
+        assert code == 200
+        assert self.stock_level() == 0
+
+        code, _ = self.buyer.new_order(self.store_id, [(self.book.id, 1)])
+        assert code == 517
+
+    def test_merge_shards(self):
+        code = self.seller.set_stock_shards(self.store_id, self.book.id, 4)
+        assert code == 200
+        code, _ = self.buyer.new_order(self.store_id, [(self.book.id, 3)])
+        assert code == 200
+
+        code = self.seller.set_stock_shards(self.store_id, self.book.id, 0)
+        assert code == 200
+        assert self.stock_level() == 7
+
+        code, _ = self.buyer.new_order(self.store_id, [(self.book.id, 7)])
+        assert code == 200
+
+    def test_invalid_shards(self):
+        code = self.seller.set_stock_shards(self.store_id, self.book.id, -1)
+        assert code == 530
+        code = self.seller.set_stock_shards(self.store_id, self.book.id, 10**6)
+        assert code == 530
+
+    def test_non_exist_book_id(self):
+        code = self.seller.set_stock_shards(self.store_id, self.book.id + "_x", 4)
+        assert code == 515
+
+    def test_non_exist_store_id(self):
+        code = self.seller.set_stock_shards(self.store_id + "_x", self.book.id, 4)
+        assert code == 513